@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+import os
+import sqlite3
+import threading
+import time
+from PIL import Image
+
+# --- Configuración ---
+RUTA_MANIFIESTO = "manifiesto_capturas.sqlite3"
+# La poda borra archivos del usuario: solo se activa si se fija algún presupuesto (0 = sin límite)
+MAX_MB = 0
+MAX_DIAS = 0
+INTERVALO_PODA_SEGUNDOS = 300
+EXTENSIONES_ALMACEN = ('.png', '.jpg', '.jpeg', '.webp')
+
+class AlmacenCapturas:
+    """
+    Manifiesto indexado de las capturas (ruta, hash, instante, respuesta, latencia) en SQLite
+    y poda opcional en segundo plano de la carpeta para mantenerla dentro de un presupuesto de
+    tamaño y antigüedad. Opcionalmente compacta las capturas antiguas a WebP o miniatura.
+    """
+    def __init__(self, carpeta, ruta_manifiesto=RUTA_MANIFIESTO, max_mb=MAX_MB, max_dias=MAX_DIAS,
+                 compactar_tras_horas=0, calidad_compactado=60, lado_miniatura=0):
+        self.carpeta = carpeta
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_segundos = max_dias * 24 * 60 * 60
+        self.compactar_tras_segundos = compactar_tras_horas * 60 * 60  # 0 = no compactar
+        self.calidad_compactado = calidad_compactado
+        self.lado_miniatura = lado_miniatura  # 0 = conserva la resolución al compactar
+        self._bloqueo = threading.Lock()
+        self._conexion = sqlite3.connect(ruta_manifiesto, check_same_thread=False)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute(
+            """CREATE TABLE IF NOT EXISTS capturas (
+                   ruta TEXT PRIMARY KEY,
+                   hash TEXT,
+                   instante REAL NOT NULL,
+                   respuesta TEXT,
+                   latencia_ms REAL
+               )"""
+        )
+        self._conexion.execute("CREATE INDEX IF NOT EXISTS idx_capturas_instante ON capturas (instante)")
+        self._conexion.commit()
+
+    def registrar(self, ruta):
+        """Registra una captura nueva. Devuelve False si ya estaba en el manifiesto."""
+        with self._bloqueo:
+            cursor = self._conexion.execute(
+                "INSERT OR IGNORE INTO capturas (ruta, instante) VALUES (?, ?)", (ruta, time.time())
+            )
+            self._conexion.commit()
+            return cursor.rowcount == 1
+
+    def contiene(self, ruta):
+        with self._bloqueo:
+            return self._conexion.execute("SELECT 1 FROM capturas WHERE ruta = ?", (ruta,)).fetchone() is not None
+
+    def olvidar(self, ruta):
+        """Quita la captura del manifiesto para que pueda volver a procesarse."""
+        with self._bloqueo:
+            self._conexion.execute("DELETE FROM capturas WHERE ruta = ?", (ruta,))
+            self._conexion.commit()
+
+    def guardar_resultado(self, ruta, hash_imagen, respuesta, latencia_ms):
+        """Anota el hash, la respuesta y la latencia de una captura (la crea si no existía)."""
+        hash_texto = f"{hash_imagen:016x}" if isinstance(hash_imagen, int) else hash_imagen
+        with self._bloqueo:
+            self._conexion.execute(
+                """INSERT INTO capturas (ruta, hash, instante, respuesta, latencia_ms) VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT(ruta) DO UPDATE SET hash = excluded.hash, respuesta = excluded.respuesta,
+                                                   latencia_ms = excluded.latencia_ms""",
+                (ruta, hash_texto, time.time(), respuesta, round(latencia_ms, 1)),
+            )
+            self._conexion.commit()
+
+    @property
+    def poda_activa(self):
+        return bool(self.max_bytes or self.max_segundos or self.compactar_tras_segundos)
+
+    def iniciar_poda(self, shutdown_event, intervalo_segundos=INTERVALO_PODA_SEGUNDOS):
+        """
+        Poda la carpeta al arrancar y después periódicamente en un hilo en segundo plano.
+        No hace nada si no hay presupuesto de tamaño ni de antigüedad ni compactado.
+        """
+        if not self.poda_activa:
+            return None
+
+        def _bucle():
+            while True:
+                try:
+                    self.podar()
+                except Exception as e:
+                    print(f"Error al podar la carpeta de capturas: {e}")
+                if shutdown_event.wait(intervalo_segundos):
+                    return
+
+        hilo = threading.Thread(target=_bucle, name="poda-capturas", daemon=True)
+        hilo.start()
+        return hilo
+
+    def _listar_archivos(self):
+        """(ruta, tamaño, fecha de modificación) de las capturas de la carpeta, de más antigua a más nueva."""
+        archivos = []
+        with os.scandir(self.carpeta) as entradas:
+            for entrada in entradas:
+                if entrada.is_file() and entrada.name.lower().endswith(EXTENSIONES_ALMACEN):
+                    datos = entrada.stat()
+                    archivos.append((entrada.path, datos.st_size, datos.st_mtime))
+        archivos.sort(key=lambda archivo: archivo[2])
+        return archivos
+
+    def podar(self):
+        """Borra capturas por antigüedad y tamaño total, compacta las antiguas y limpia el manifiesto."""
+        ahora = time.time()
+        archivos = self._listar_archivos()
+        borradas, compactadas = [], 0
+
+        conservadas = []
+        for ruta, tamano, modificado in archivos:
+            if self.max_segundos and ahora - modificado > self.max_segundos:
+                borradas.append(ruta)
+            else:
+                conservadas.append([ruta, tamano, modificado])
+
+        if self.compactar_tras_segundos:
+            for archivo in conservadas:
+                ruta, _, modificado = archivo
+                if ahora - modificado > self.compactar_tras_segundos and not ruta.lower().endswith(".webp"):
+                    nueva = self._compactar(ruta)
+                    if nueva:
+                        archivo[0], archivo[1] = nueva, os.path.getsize(nueva)
+                        compactadas += 1
+
+        total = sum(tamano for _, tamano, _ in conservadas)
+        while self.max_bytes and conservadas and total > self.max_bytes:
+            ruta, tamano, _ = conservadas.pop(0)  # La más antigua primero
+            borradas.append(ruta)
+            total -= tamano
+
+        for ruta in borradas:
+            try:
+                os.remove(ruta)
+            except OSError as e:
+                print(f"No se pudo borrar la captura '{ruta}': {e}")
+
+        with self._bloqueo:
+            self._conexion.executemany("DELETE FROM capturas WHERE ruta = ?", [(ruta,) for ruta in borradas])
+            if self.max_segundos:
+                # Las entradas sin archivo (p. ej. capturas solo en memoria) también caducan
+                self._conexion.execute("DELETE FROM capturas WHERE instante < ?", (ahora - self.max_segundos,))
+            self._conexion.commit()
+
+        if borradas or compactadas:
+            print(f"Carpeta de capturas podada: {len(borradas)} borradas, {compactadas} compactadas, "
+                  f"{total / (1024 * 1024):.1f} MB en uso.")
+
+    def _compactar(self, ruta):
+        """Recodifica una captura a WebP (y opcionalmente a miniatura). Devuelve la nueva ruta."""
+        nueva = f"{os.path.splitext(ruta)[0]}.webp"
+        temporal = f"{nueva}.tmp"
+        try:
+            with Image.open(ruta) as imagen:
+                imagen = imagen.convert("RGB")
+                if self.lado_miniatura:
+                    imagen.thumbnail((self.lado_miniatura, self.lado_miniatura), Image.Resampling.LANCZOS)
+                imagen.save(temporal, format="WEBP", quality=self.calidad_compactado)
+            os.replace(temporal, nueva)
+            os.utime(nueva, (os.path.getatime(ruta), os.path.getmtime(ruta)))  # Conserva la antigüedad
+            os.remove(ruta)
+        except Exception as e:
+            print(f"No se pudo compactar la captura '{ruta}': {e}")
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            return None
+        with self._bloqueo:
+            self._conexion.execute("UPDATE capturas SET ruta = ? WHERE ruta = ?", (nueva, ruta))
+            self._conexion.commit()
+        return nueva
+
+    def cerrar(self):
+        with self._bloqueo:
+            self._conexion.close()
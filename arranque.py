@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import importlib
+import os
+import subprocess
+import sys
+import threading
+import time
+
+# Módulos que main() importa antes de mostrar la bandeja (fuera del modo lote)
+MODULOS_ARRANQUE = ("main", "captura_logic", "gemini_handler", "pipeline", "ticker_display")
+# Módulos que no hacen falta para mostrar la bandeja ni escuchar las teclas, y que se
+# cargan en segundo plano para que la primera captura no tenga que esperar por ellos.
+MODULOS_DIFERIDOS = (
+    "mss",
+    "mss.tools",
+    "pyautogui",
+    "httpx",
+    "google.genai",
+    "google.genai.types",
+    "PIL.ImageChops",
+    "google_search_handler",
+)
+
+def precargar_modulos(modulos=MODULOS_DIFERIDOS):
+    """Importa los módulos diferidos uno a uno, sin detenerse si alguno falla."""
+    inicio = time.perf_counter()
+    for nombre in modulos:
+        try:
+            importlib.import_module(nombre)
+        except Exception as e:
+            print(f"No se pudo precargar el módulo '{nombre}': {e}")
+    print(f"Módulos diferidos precargados en {(time.perf_counter() - inicio) * 1000:.0f} ms.")
+
+def precargar_en_segundo_plano(modulos=MODULOS_DIFERIDOS):
+    """Lanza la precarga en un hilo de baja prioridad práctica (daemon)."""
+    hilo = threading.Thread(target=precargar_modulos, args=(modulos,), name="precarga", daemon=True)
+    hilo.start()
+    return hilo
+
+def _medir_importaciones(codigo):
+    """Ejecuta 'codigo' con -X importtime y devuelve [(modulo, propio_us, acumulado_us)]."""
+    directorio = os.path.dirname(os.path.abspath(__file__))
+    proceso = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", codigo],
+        capture_output=True, text=True, cwd=directorio,
+    )
+    medidas = []
+    for linea in proceso.stderr.splitlines():
+        if not linea.startswith("import time:") or "self [us]" in linea:
+            continue
+        try:
+            propio, acumulado, modulo = linea[len("import time:"):].split("|")
+            medidas.append((modulo.strip(), int(propio), int(acumulado)))
+        except ValueError:
+            continue
+    if proceso.returncode != 0:
+        print(f"Aviso: la medición terminó con errores:\n{proceso.stderr.splitlines()[-1] if proceso.stderr else ''}")
+    return medidas
+
+def informe_importaciones(limite=20):
+    """Muestra qué importaciones cuestan más al arrancar y cuánto cuestan las diferidas."""
+    importar_arranque = "import " + ", ".join(MODULOS_ARRANQUE)
+    arranque = _medir_importaciones(importar_arranque)
+    total_arranque = sum(propio for _, propio, _ in arranque)
+    print(f"Importaciones al arrancar ({importar_arranque}): {total_arranque / 1000:.0f} ms en total")
+    print(f"{'acumulado ms':>13} {'propio ms':>10}  módulo")
+    for modulo, propio, acumulado in sorted(arranque, key=lambda m: m[2], reverse=True)[:limite]:
+        print(f"{acumulado / 1000:13.1f} {propio / 1000:10.1f}  {modulo}")
+
+    cargados = {modulo for modulo, _, _ in arranque}
+    diferidos = _medir_importaciones(f"{importar_arranque}, arranque; arranque.precargar_modulos()")
+    extra = [(m, p, a) for m, p, a in diferidos if m not in cargados]
+    total_diferido = sum(propio for _, propio, _ in extra)
+    print(f"\nImportaciones diferidas (se cargan tras mostrar la bandeja): {total_diferido / 1000:.0f} ms en total")
+    principales = [m for m in extra if m[0] in MODULOS_DIFERIDOS]
+    for modulo, propio, acumulado in sorted(principales, key=lambda m: m[2], reverse=True)[:limite]:
+        print(f"{acumulado / 1000:13.1f} {propio / 1000:10.1f}  {modulo}")
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Banco de pruebas sin conexión: reproduce una carpeta de capturas a través de
+ManejadorCapturas / GoogleSearchHandler contra un servidor local que imita la API
+de Gemini, sin bandeja del sistema ni listeners de teclado/ratón.
+
+Uso: python benchmark.py capturas --repeticiones 3 --concurrencia 4 --latencia-media-ms 400
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from trazas import percentil
+
+EXTENSIONES_IMAGEN = ('.png', '.jpg', '.jpeg', '.webp')
+
+class ConfigSimulador:
+    """Comportamiento del servidor simulado."""
+    def __init__(self, latencia_media_ms=400.0, latencia_sigma=0.5, tasa_error=0.0, respuestas=("A",)):
+        self.latencia_media_ms = latencia_media_ms
+        self.latencia_sigma = latencia_sigma  # Dispersión de la distribución log-normal (0 = fija)
+        self.tasa_error = tasa_error
+        self.respuestas = respuestas
+
+    def muestrear_latencia(self):
+        """Latencia en segundos según una log-normal con la media indicada."""
+        if self.latencia_sigma <= 0:
+            return self.latencia_media_ms / 1000
+        mu = math.log(self.latencia_media_ms) - self.latencia_sigma ** 2 / 2
+        return random.lognormvariate(mu, self.latencia_sigma) / 1000
+
+def _cuerpo_respuesta(texto, modelo):
+    return {
+        "candidates": [{"content": {"role": "model", "parts": [{"text": texto}]}, "finishReason": "STOP", "index": 0}],
+        "usageMetadata": {"promptTokenCount": 1290, "candidatesTokenCount": 1, "totalTokenCount": 1291},
+        "modelVersion": modelo,
+    }
+
+def crear_simulador(config, puerto=0):
+    """Arranca en un hilo un servidor HTTP que responde como la API generateContent de Gemini."""
+    class ManejadorSimulador(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Mantiene la conexión abierta, como el servidor real
+
+        def log_message(self, *args):
+            pass
+
+        def _responder_json(self, estado, cuerpo):
+            datos = json.dumps(cuerpo).encode("utf-8")
+            self.send_response(estado)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(datos)))
+            self.end_headers()
+            self.wfile.write(datos)
+
+        def do_GET(self):
+            # Usado por el calentamiento de la conexión (models.get)
+            self._responder_json(200, {"name": self.path.rsplit("/", 1)[-1]})
+
+        def do_POST(self):
+            longitud = int(self.headers.get("Content-Length", 0))
+            self.rfile.read(longitud)
+            time.sleep(config.muestrear_latencia())
+            modelo = self.path.split("/models/")[-1].split(":")[0]
+
+            if random.random() < config.tasa_error:
+                self._responder_json(503, {"error": {"code": 503, "message": "Error simulado", "status": "UNAVAILABLE"}})
+                return
+
+            cuerpo = _cuerpo_respuesta(random.choice(config.respuestas), modelo)
+            if ":streamGenerateContent" in self.path:
+                datos = f"data: {json.dumps(cuerpo)}\r\n\r\n".encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Content-Length", str(len(datos)))
+                self.end_headers()
+                self.wfile.write(datos)
+            else:
+                self._responder_json(200, cuerpo)
+
+    class ServidorSimulador(ThreadingHTTPServer):
+        daemon_threads = True
+
+        def handle_error(self, request, client_address):
+            # El cliente cancela las peticiones perdedoras de la carrera: no es un error del simulador
+            if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+                super().handle_error(request, client_address)
+
+    servidor = ServidorSimulador(("127.0.0.1", puerto), ManejadorSimulador)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+def listar_imagenes(directorio):
+    return sorted(
+        os.path.join(directorio, nombre) for nombre in os.listdir(directorio)
+        if nombre.lower().endswith(EXTENSIONES_IMAGEN)
+    )
+
+def ejecutar_benchmark(imagenes, ruta, repeticiones, concurrencia):
+    """Procesa las imágenes en ráfaga con el pool indicado y devuelve las métricas."""
+    from gemini_handler import ManejadorCapturas, MODELO_GEMINI
+    from prompts import PROMPT_PARA_GOOGLE_SEARCH
+
+    manejador = ManejadorCapturas()
+    manejador._obtener_cliente()
+    google_handler = manejador._obtener_google_handler() if ruta == "busqueda" else None
+
+    def _procesar(ruta_imagen):
+        inicio = time.perf_counter()
+        if google_handler:
+            respuesta, _ = google_handler.process_image(ruta_imagen, PROMPT_PARA_GOOGLE_SEARCH, MODELO_GEMINI)
+        else:
+            imagen = manejador.cargar_imagen(ruta_imagen)
+            imagen, contenido = manejador.preparar_imagen(imagen, ruta_imagen)
+            respuesta = manejador.obtener_respuesta(imagen, os.path.basename(ruta_imagen), None, contenido)
+        return (time.perf_counter() - inicio) * 1000, respuesta
+
+    # Una primera petición fuera de la medida abre la conexión
+    _procesar(imagenes[0])
+
+    tareas = [imagen for _ in range(repeticiones) for imagen in imagenes]
+    tracemalloc.start()
+    memoria_inicial, _ = tracemalloc.get_traced_memory()
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as ejecutor:
+        resultados = list(ejecutor.map(_procesar, tareas))
+    duracion = time.perf_counter() - inicio
+    memoria_final, memoria_pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    manejador.cerrar()
+
+    latencias = sorted(latencia for latencia, _ in resultados)
+    errores = sum(1 for _, respuesta in resultados if not respuesta)
+    return {
+        "peticiones": len(resultados),
+        "errores": errores,
+        "duracion_s": round(duracion, 3),
+        "rendimiento_por_s": round(len(resultados) / duracion, 2) if duracion else None,
+        **{f"latencia_p{p}_ms": round(percentil(latencias, p), 1) for p in (50, 95, 99)},
+        "latencia_max_ms": round(latencias[-1], 1),
+        "memoria_crecimiento_kb": round((memoria_final - memoria_inicial) / 1024, 1),
+        "memoria_pico_kb": round(memoria_pico / 1024, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de TARCA contra un simulador local de Gemini.")
+    parser.add_argument("directorio", help="Carpeta con capturas a reproducir")
+    parser.add_argument("--ruta", choices=("gemini", "busqueda", "carrera"), default="gemini")
+    parser.add_argument("--repeticiones", type=int, default=1)
+    parser.add_argument("--concurrencia", type=int, default=4)
+    parser.add_argument("--latencia-media-ms", type=float, default=400.0)
+    parser.add_argument("--latencia-sigma", type=float, default=0.5)
+    parser.add_argument("--tasa-error", type=float, default=0.0)
+    parser.add_argument("--respuestas", default="A,B,C,D,AC", help="Respuestas posibles separadas por comas")
+    parser.add_argument("--streaming", action="store_true")
+    parser.add_argument("--cache", action="store_true", help="Mantiene activa la caché de respuestas")
+    parser.add_argument("--planificador", action="store_true", help="Usa el planificador con reintentos y niveles")
+    parser.add_argument("--json", help="Guarda el informe en este archivo")
+    args = parser.parse_args()
+
+    imagenes = listar_imagenes(args.directorio)
+    if not imagenes:
+        print(f"No hay imágenes en '{args.directorio}'.")
+        return 1
+
+    config = ConfigSimulador(args.latencia_media_ms, args.latencia_sigma, args.tasa_error,
+                             tuple(r.strip() for r in args.respuestas.split(",") if r.strip()))
+    servidor = crear_simulador(config)
+
+    # Todo el entorno se fija antes de importar los módulos de la aplicación
+    os.environ["GEMINI_BASE_URL"] = f"http://127.0.0.1:{servidor.server_address[1]}/"
+    os.environ["GEMINI_API_KEY"] = "simulada"
+    os.environ["GOOGLE_SEARCH"] = "false"
+    os.environ["CARRERA_MODELOS"] = "true" if args.ruta == "carrera" else "false"
+    os.environ["STREAMING"] = "true" if args.streaming else "false"
+    os.environ["CACHE_RESPUESTAS"] = "true" if args.cache else "false"
+    os.environ["PLANIFICADOR"] = "true" if args.planificador else "false"
+
+    print(f"Simulador en {os.environ['GEMINI_BASE_URL']} - {len(imagenes)} imágenes x {args.repeticiones}, "
+          f"concurrencia {args.concurrencia}, ruta '{args.ruta}'")
+    informe = ejecutar_benchmark(imagenes, args.ruta, args.repeticiones, args.concurrencia)
+    servidor.shutdown()
+
+    for clave, valor in informe.items():
+        print(f"  {clave}: {valor}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(informe, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
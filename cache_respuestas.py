@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# --- Configuración ---
+RUTA_CACHE = "cache_respuestas.json"
+RUTA_CACHE_TEXTO = "cache_respuestas_texto.json"  # Claves de texto reconocido por OCR (solo coincidencia exacta)
+MAX_ENTRADAS = 256
+TTL_SEGUNDOS = 24 * 60 * 60
+
+def calcular_huella(contenido):
+    """
+    Huella exacta de 64 bits de lo que se envía al modelo: los bytes ya codificados si el
+    preprocesado recodificó la imagen (types.Part) o, si no, los píxeles de la imagen.
+    Un hash perceptual de toda la pantalla no distingue dos preguntas con la misma
+    maquetación, así que solo se reutiliza la respuesta de una captura idéntica.
+    """
+    resumen = hashlib.blake2b(digest_size=8)
+    datos = getattr(getattr(contenido, "inline_data", None), "data", None)
+    if datos is not None:
+        resumen.update(datos)
+    else:
+        resumen.update(f"{contenido.mode}:{contenido.size[0]}x{contenido.size[1]}:".encode("ascii"))
+        resumen.update(contenido.tobytes())
+    return int.from_bytes(resumen.digest(), "big")
+
+class CacheRespuestas:
+    """Caché LRU con caducidad que asocia una huella exacta (de la captura o de su texto) a la respuesta del modelo."""
+    def __init__(self, ruta=RUTA_CACHE, max_entradas=MAX_ENTRADAS, ttl_segundos=TTL_SEGUNDOS):
+        self.ruta = ruta
+        self.max_entradas = max_entradas
+        self.ttl_segundos = ttl_segundos
+        self._entradas = OrderedDict()  # hash -> (respuesta, instante en que se guardó)
+        self._bloqueo = threading.Lock()
+        self._cargar()
+
+    def buscar(self, hash_imagen):
+        """Devuelve la respuesta guardada para esa huella, o None si no hay ninguna válida."""
+        ahora = time.time()
+        with self._bloqueo:
+            self._eliminar_caducadas(ahora)
+            if hash_imagen not in self._entradas:
+                return None
+            self._entradas.move_to_end(hash_imagen)
+            return self._entradas[hash_imagen][0]
+
+    def guardar(self, hash_imagen, respuesta):
+        """Guarda la respuesta, expulsa las entradas menos usadas y persiste la caché en disco."""
+        if not respuesta:
+            return
+        with self._bloqueo:
+            self._entradas[hash_imagen] = (respuesta, time.time())
+            self._entradas.move_to_end(hash_imagen)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+            self._persistir()
+
+    def _eliminar_caducadas(self, ahora):
+        caducadas = [h for h, (_, instante) in self._entradas.items() if ahora - instante > self.ttl_segundos]
+        for hash_guardado in caducadas:
+            del self._entradas[hash_guardado]
+
+    def _cargar(self):
+        """Carga la caché guardada en disco, si existe."""
+        if not os.path.exists(self.ruta):
+            return
+        try:
+            with open(self.ruta, "r", encoding="utf-8") as f:
+                datos = json.load(f)
+            for entrada in datos:
+                self._entradas[int(entrada["hash"], 16)] = (entrada["respuesta"], entrada["instante"])
+            self._eliminar_caducadas(time.time())
+            print(f"Caché de respuestas cargada: {len(self._entradas)} entradas.")
+        except Exception as e:
+            print(f"Error al cargar la caché de respuestas '{self.ruta}': {e}")
+            self._entradas.clear()
+
+    def _persistir(self):
+        """Escribe la caché en disco de forma atómica (archivo temporal + reemplazo)."""
+        datos = [
+            {"hash": f"{h:016x}", "respuesta": respuesta, "instante": instante}
+            for h, (respuesta, instante) in self._entradas.items()
+        ]
+        ruta_temporal = f"{self.ruta}.tmp"
+        try:
+            with open(ruta_temporal, "w", encoding="utf-8") as f:
+                json.dump(datos, f)
+            os.replace(ruta_temporal, self.ruta)
+        except Exception as e:
+            print(f"Error al guardar la caché de respuestas '{self.ruta}': {e}")
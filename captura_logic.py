@@ -1,90 +1,448 @@
 # -*- coding: utf-8 -*-
 import os
+import queue
 import threading
+import time
 from datetime import datetime
-import mss
-import mss.tools
-import pyautogui
 from pynput import keyboard, mouse
+from trazas import registro_trazas
+from metricas import registro_metricas
 
 # --- Configuración ---
 CAPTURE_FOLDER = "capturas"
-COOLDOWN_CAPTURA_SEGUNDOS = 2  # Tiempo de espera en segundos entre capturas
-captura_en_cooldown = False
+COOLDOWN_CAPTURA_SEGUNDOS = 2  # Espera máxima entre capturas mientras el pipeline está ocupado
+INTERVALO_MINIMO_CAPTURA_SEGUNDOS = 0.25  # Antirrebote: separación mínima entre dos capturas
+MAX_CAPTURAS_EN_CURSO = 1  # Con más capturas en proceso, la siguiente espera (enfriamiento adaptativo)
 
-def obtener_monitor_con_cursor():
-    """Determina en qué monitor se encuentra el cursor."""
+# Modo en memoria: la captura pasa directamente al modelo sin escribir/leer el PNG.
+CAPTURA_EN_MEMORIA = False
+GUARDAR_CAPTURAS = True  # En modo en memoria, guarda también el PNG en segundo plano
+TAMANO_COLA_CAPTURAS = 4
+TTL_MONITORES_SEGUNDOS = 30  # Cada cuánto se vuelve a enumerar la disposición de monitores
+TAMANO_CELDA_MONITOR = 256  # Tamaño en píxeles de las celdas del índice de monitores
+# Detección de cambios entre capturas del mismo monitor (sobre una versión reducida en grises)
+FACTOR_REDUCCION_CAMBIOS = 8  # Cada bloque de 8x8 píxeles se reduce a su media
+UMBRAL_DIFERENCIA_CAMBIOS = 6  # Diferencia media (0-255) a partir de la cual un bloque ha cambiado
+
+cola_capturas = queue.Queue(maxsize=TAMANO_COLA_CAPTURAS)  # Capturas pendientes de procesar
+_cola_escritura = queue.Queue()  # Capturas pendientes de guardar en disco
+_hilo_escritor = None
+_disparos = registro_metricas.contador("tarca_disparos_total", "Pulsaciones de captura recibidas por los listeners")
+_capturas = registro_metricas.contador("tarca_capturas_total", "Capturas de pantalla por resultado")
+registro_metricas.indicador("tarca_cola_capturas", "Capturas en memoria pendientes de procesar", funcion=cola_capturas.qsize)
+detector_cambios = None  # DetectorCambios activo (DETECTAR_CAMBIOS)
+_al_capturar_sin_cambios = None  # Callback que vuelve a mostrar la última respuesta
+
+class Captura:
+    """Captura en memoria tal como la devuelve mss, lista para el modelo."""
+    def __init__(self, imagen_capturada, monitor, ruta=None, cursor=None, traza=None):
+        self.imagen_capturada = imagen_capturada  # Objeto ScreenShot de mss (buffer BGRA)
+        self.traza = traza  # Traza de latencias de esta captura
+        self.monitor = monitor
+        self.cursor = cursor  # Posición del cursor relativa al monitor capturado (x, y)
+        self.ruta = ruta  # Ruta donde se guardará (o no) el PNG
+        self.timestamp = datetime.now()
+
+    def a_imagen_pil(self):
+        """Convierte el buffer BGRA de mss en una imagen de PIL sin pasar por disco."""
+        from PIL import Image
+        return Image.frombytes("RGB", self.imagen_capturada.size, self.imagen_capturada.bgra, "raw", "BGRX")
+
+class DetectorCambios:
+    """
+    Compara cada captura con la anterior del mismo monitor sobre una versión reducida en
+    escala de grises (media de bloques de FACTOR_REDUCCION_CAMBIOS píxeles). Solo decide si
+    la captura puede saltarse: una captura con cambios se envía siempre entera, porque la
+    caja cambiada puede ser solo el reloj o la pregunta sin sus opciones.
+    Usa NumPy si está instalado y, si no, ImageChops de PIL.
+    """
+    def __init__(self, factor=FACTOR_REDUCCION_CAMBIOS, umbral=UMBRAL_DIFERENCIA_CAMBIOS):
+        self.factor = factor
+        self.umbral = umbral
+        self._anteriores = {}  # (left, top, width, height) del monitor -> captura reducida
+        self._bloqueo = threading.Lock()
+        try:
+            import numpy  # Dependencia opcional
+            self._np = numpy
+        except ImportError:
+            self._np = None
+
+    def _reducir(self, imagen_capturada):
+        ancho, alto = imagen_capturada.size
+        ancho_r, alto_r = ancho // self.factor, alto // self.factor
+        if self._np is not None:
+            np = self._np
+            pixeles = np.frombuffer(imagen_capturada.bgra, dtype=np.uint8).reshape(alto, ancho, 4)
+            pixeles = pixeles[:alto_r * self.factor, :ancho_r * self.factor, :3]
+            bloques = pixeles.reshape(alto_r, self.factor, ancho_r, self.factor, 3)
+            return bloques.mean(axis=(1, 3, 4))  # Media de los tres canales en cada bloque
+        from PIL import Image
+        imagen = Image.frombuffer("RGBX", imagen_capturada.size, imagen_capturada.bgra, "raw", "BGRX", 0, 1)
+        return imagen.convert("L").reduce(self.factor)
+
+    def _caja_cambiada(self, anterior, actual):
+        """Rectángulo cambiado en coordenadas de la imagen reducida, o None si no hay cambios."""
+        if self._np is not None:
+            cambiados = self._np.abs(actual - anterior) >= self.umbral
+            filas = self._np.flatnonzero(cambiados.any(axis=1))
+            columnas = self._np.flatnonzero(cambiados.any(axis=0))
+            if not len(filas):
+                return None
+            return int(columnas[0]), int(filas[0]), int(columnas[-1]) + 1, int(filas[-1]) + 1
+        from PIL import ImageChops
+        diferencia = ImageChops.difference(anterior, actual).point(lambda v: 255 if v >= self.umbral else 0)
+        return diferencia.getbbox()
+
+    def comparar(self, monitor, imagen_capturada):
+        """
+        Devuelve (cambiada, caja). 'caja' es el rectángulo (izq, arriba, der, abajo) que cambió,
+        en píxeles del monitor, solo para informar; es None si no cambió nada o si no hay
+        captura anterior comparable (primera captura o cambio de resolución).
+        """
+        clave = (monitor["left"], monitor["top"], monitor["width"], monitor["height"])
+        actual = self._reducir(imagen_capturada)
+        with self._bloqueo:
+            anterior = self._anteriores.get(clave)
+            self._anteriores[clave] = actual
+        tamano_anterior = None if anterior is None else getattr(anterior, "shape", None) or anterior.size
+        tamano_actual = getattr(actual, "shape", None) or actual.size
+        if anterior is None or tamano_anterior != tamano_actual:
+            return True, None
+
+        caja = self._caja_cambiada(anterior, actual)
+        if caja is None:
+            return False, None
+        return True, tuple(coordenada * self.factor for coordenada in caja)
+
+    def olvidar(self):
+        """Descarta las capturas de referencia (la siguiente se tratará como nueva)."""
+        with self._bloqueo:
+            self._anteriores.clear()
+
+def configurar_deteccion_cambios(activa, al_sin_cambios=None):
+    """
+    Activa la detección de cambios entre capturas. 'al_sin_cambios' se llama cuando la
+    captura es igual a la anterior y debe devolver True si ya se volvió a mostrar la
+    respuesta; si devuelve False la captura se procesa igualmente.
+    """
+    global detector_cambios, _al_capturar_sin_cambios
+    detector_cambios = DetectorCambios() if activa else None
+    _al_capturar_sin_cambios = al_sin_cambios
+
+def configurar_captura(en_memoria=False, guardar_en_disco=True):
+    """Configura el modo de entrega de las capturas y arranca el escritor en segundo plano si hace falta."""
+    global CAPTURA_EN_MEMORIA, GUARDAR_CAPTURAS, _hilo_escritor
+    CAPTURA_EN_MEMORIA = en_memoria
+    GUARDAR_CAPTURAS = guardar_en_disco
+
+    if CAPTURA_EN_MEMORIA and GUARDAR_CAPTURAS and _hilo_escritor is None:
+        _hilo_escritor = threading.Thread(target=_escritor_capturas, daemon=True)
+        _hilo_escritor.start()
+
+def _escritor_capturas():
+    """Hilo que guarda en disco las capturas del modo en memoria sin bloquear el procesamiento."""
+    while True:
+        imagen_capturada, nombre_archivo = _cola_escritura.get()
+        try:
+            guardar_png(imagen_capturada, nombre_archivo)
+            print(f"Captura guardada en: {nombre_archivo}")
+        except Exception as e:
+            print(f"Error al guardar la captura '{nombre_archivo}': {e}")
+
+def guardar_png(imagen_capturada, nombre_archivo):
+    """
+    Escribe el PNG en un archivo temporal y lo renombra al terminar. El renombrado es atómico,
+    así que el observador solo ve el archivo final cuando ya está completo.
+    """
+    import mss.tools
+    ruta_temporal = f"{nombre_archivo}.tmp"
+    mss.tools.to_png(imagen_capturada.rgb, imagen_capturada.size, output=ruta_temporal)
+    os.replace(ruta_temporal, nombre_archivo)
+
+def _encolar_captura(captura):
+    """Añade la captura a la cola; si está llena descarta la más antigua."""
+    while True:
+        try:
+            cola_capturas.put_nowait(captura)
+            return
+        except queue.Full:
+            try:
+                descartada = cola_capturas.get_nowait()
+                _capturas.inc(resultado="descartada")
+                print(f"Cola de capturas llena, se descarta la captura de {descartada.timestamp:%H:%M:%S}.")
+            except queue.Empty:
+                pass
+
+def obtener_posicion_cursor():
+    """Devuelve la posición absoluta del cursor o None si no se puede obtener."""
     try:
+        import pyautogui  # Importación diferida: solo hace falta al capturar
         mouse_x, mouse_y = pyautogui.position()
+        return mouse_x, mouse_y
     except Exception as e:
         print(f"Error al obtener la posición del cursor con PyAutoGUI: {e}")
         return None
 
-    sct = mss.mss()
-    monitores = sct.monitors
+class ServicioCaptura:
+    """
+    Mantiene una instancia de mss por hilo (mss no se comparte entre hilos) y la
+    geometría de los monitores en caché, con un índice por celdas para localizar
+    el monitor del cursor en tiempo constante.
+    """
+    def __init__(self, ttl_monitores=TTL_MONITORES_SEGUNDOS):
+        self.ttl_monitores = ttl_monitores
+        self._local = threading.local()
+        self._bloqueo = threading.Lock()
+        self._grabbers = []  # (hilo, instancia de mss) para poder cerrarlas
+        self._monitores = []
+        self._indice = {}  # (columna, fila) -> monitores que tocan esa celda
+        self._instante_monitores = 0.0
 
-    if not monitores:
-        print("Error: No se pudieron detectar monitores.")
+    def _grabber(self):
+        """Instancia de mss del hilo actual; cierra las de hilos que ya terminaron."""
+        sct = getattr(self._local, "sct", None)
+        if sct is None:
+            import mss  # Importación diferida: solo hace falta al capturar
+            sct = mss.mss()
+            self._local.sct = sct
+            with self._bloqueo:
+                vivos = []
+                for hilo, instancia in self._grabbers:
+                    if hilo.is_alive():
+                        vivos.append((hilo, instancia))
+                    else:
+                        instancia.close()
+                vivos.append((threading.current_thread(), sct))
+                self._grabbers = vivos
+        return sct
+
+    def refrescar_monitores(self):
+        """Vuelve a enumerar los monitores (una instancia nueva evita la lista cacheada por mss)."""
+        import mss
+        with mss.mss() as sct:
+            monitores = list(sct.monitors)
+        indice = {}
+        for monitor in monitores[1:]:
+            for columna in range(monitor["left"] // TAMANO_CELDA_MONITOR,
+                                 (monitor["left"] + monitor["width"] - 1) // TAMANO_CELDA_MONITOR + 1):
+                for fila in range(monitor["top"] // TAMANO_CELDA_MONITOR,
+                                  (monitor["top"] + monitor["height"] - 1) // TAMANO_CELDA_MONITOR + 1):
+                    indice.setdefault((columna, fila), []).append(monitor)
+        with self._bloqueo:
+            self._monitores = monitores
+            self._indice = indice
+            self._instante_monitores = time.monotonic()
+        return monitores
+
+    def monitores(self):
+        """Lista de monitores de mss (el 0 es el escritorio completo), refrescada si caducó."""
+        if not self._monitores or time.monotonic() - self._instante_monitores > self.ttl_monitores:
+            return self.refrescar_monitores()
+        return self._monitores
+
+    def _buscar_en_indice(self, x, y):
+        celda = (x // TAMANO_CELDA_MONITOR, y // TAMANO_CELDA_MONITOR)
+        for monitor in self._indice.get(celda, ()):
+            if (monitor["left"] <= x < monitor["left"] + monitor["width"] and
+                    monitor["top"] <= y < monitor["top"] + monitor["height"]):
+                return monitor
         return None
 
-    for i, monitor_details in enumerate(monitores):
-        if i == 0: continue
-        if (monitor_details["left"] <= mouse_x < monitor_details["left"] + monitor_details["width"] and
-                monitor_details["top"] <= mouse_y < monitor_details["top"] + monitor_details["height"]):
-            return monitor_details
+    def monitor_en(self, x, y):
+        """Monitor que contiene el punto; si no aparece, la disposición pudo cambiar y se refresca."""
+        monitores = self.monitores()
+        monitor = self._buscar_en_indice(x, y)
+        if monitor is None:
+            monitores = self.refrescar_monitores()
+            monitor = self._buscar_en_indice(x, y)
+        if monitor:
+            return monitor
+        if not monitores:
+            return None
+        return monitores[1] if len(monitores) > 1 else monitores[0]
+
+    def capturar(self, monitor):
+        """Captura el monitor con la instancia de mss del hilo actual."""
+        return self._grabber().grab(monitor)
+
+    def cerrar(self):
+        """Cierra todas las instancias de mss abiertas."""
+        with self._bloqueo:
+            for _, instancia in self._grabbers:
+                instancia.close()
+            self._grabbers = []
 
-    return monitores[1] if len(monitores) > 1 else monitores[0]
+servicio_captura = ServicioCaptura()
+
+def obtener_monitor_con_cursor(posicion_cursor=None):
+    """Determina en qué monitor se encuentra el cursor."""
+    if posicion_cursor is None:
+        posicion_cursor = obtener_posicion_cursor()
+    if posicion_cursor is None:
+        return None
 
-def realizar_captura_pantalla():
-    """Captura el monitor donde está el cursor y guarda la imagen."""
-    global captura_en_cooldown
-    monitor_a_capturar = obtener_monitor_con_cursor()
+    monitor = servicio_captura.monitor_en(*posicion_cursor)
+    if not monitor:
+        print("Error: No se pudieron detectar monitores.")
+    return monitor
+
+def realizar_captura_pantalla(instante_disparo=None):
+    """Captura el monitor donde está el cursor y la guarda o la entrega en memoria."""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    traza = registro_trazas.nueva_traza(timestamp, inicio=instante_disparo)
+    traza.marcar_desde_ultimo("disparo")  # Desde la tecla/clic hasta que arranca el hilo de captura
+
+    with traza.span("monitor"):
+        posicion_cursor = obtener_posicion_cursor()
+        monitor_a_capturar = obtener_monitor_con_cursor(posicion_cursor) if posicion_cursor else None
     if not monitor_a_capturar:
-        captura_en_cooldown = False
+        _capturas.inc(resultado="sin_monitor")
+        traza.finalizar(error="sin_monitor")
         return
 
     try:
         if not os.path.exists(CAPTURE_FOLDER):
             os.makedirs(CAPTURE_FOLDER)
 
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
         nombre_archivo = os.path.join(CAPTURE_FOLDER, f"captura_{timestamp}.png")
 
-        with mss.mss() as sct:
-            imagen_capturada = sct.grab(monitor_a_capturar)
-            mss.tools.to_png(imagen_capturada.rgb, imagen_capturada.size, output=nombre_archivo)
-        
-        print(f"Captura guardada en: {nombre_archivo}")
+        with traza.span("captura"):
+            imagen_capturada = servicio_captura.capturar(monitor_a_capturar)
+
+        if detector_cambios:
+            with traza.span("cambios"):
+                cambiada, caja = detector_cambios.comparar(monitor_a_capturar, imagen_capturada)
+            if not cambiada and _al_capturar_sin_cambios and _al_capturar_sin_cambios():
+                print("La pantalla no ha cambiado desde la captura anterior; se repite la última respuesta.")
+                _capturas.inc(resultado="sin_cambios")
+                traza.finalizar(resultado="sin_cambios")
+                return
+            if caja:
+                print(f"Zona cambiada: {caja}; se envía la captura entera.")
+
+        cursor_relativo = (posicion_cursor[0] - monitor_a_capturar["left"], posicion_cursor[1] - monitor_a_capturar["top"])
+        if CAPTURA_EN_MEMORIA:
+            _encolar_captura(Captura(imagen_capturada, monitor_a_capturar, nombre_archivo, cursor_relativo, traza))
+            if GUARDAR_CAPTURAS:
+                _cola_escritura.put((imagen_capturada, nombre_archivo))
+        else:
+            from preprocesado import registro_cursores  # PIL ya está precargado a estas alturas
+            # Antes de escribir el PNG: el observador puede procesarlo en cuanto aparece
+            registro_cursores.registrar(nombre_archivo, cursor_relativo)
+            with traza.span("png"):
+                guardar_png(imagen_capturada, nombre_archivo)
+            print(f"Captura guardada en: {nombre_archivo}")
+        _capturas.inc(resultado="completa")
 
     except Exception as e:
         print(f"Error al capturar la pantalla: {e}")
-    finally:
-        threading.Timer(COOLDOWN_CAPTURA_SEGUNDOS, resetear_cooldown_captura).start()
+        _capturas.inc(resultado="error")
+        registro_metricas.registrar_error("captura", e)
+        traza.finalizar(error=str(e))
+
+class DespachadorDisparos:
+    """
+    Único hilo que atiende las pulsaciones de captura. Las pulsaciones que llegan mientras
+    espera se agrupan y solo se conserva la más reciente. El enfriamiento se adapta a la
+    ocupación real del pipeline: si está libre se captura enseguida (respetando solo el
+    antirrebote) y si está ocupado se espera a que se libere, como mucho COOLDOWN_CAPTURA_SEGUNDOS.
+    """
+    def __init__(self, ocupacion=None, intervalo_minimo=INTERVALO_MINIMO_CAPTURA_SEGUNDOS,
+                 espera_maxima=COOLDOWN_CAPTURA_SEGUNDOS, max_en_curso=MAX_CAPTURAS_EN_CURSO):
+        self.ocupacion = ocupacion or (lambda: 0)  # Capturas pendientes o en proceso
+        self.intervalo_minimo = intervalo_minimo
+        self.espera_maxima = espera_maxima
+        self.max_en_curso = max_en_curso
+        self._condicion = threading.Condition()
+        self._pendiente = None  # Instante (time.time()) de la pulsación pendiente más reciente
+        self._agrupadas = 0
+        self._ultima_captura = 0.0  # time.monotonic() de la última captura
+        self._hilo = None
+
+    def configurar(self, ocupacion=None, espera_maxima=None):
+        """Ajusta la fuente de ocupación y la espera máxima (p. ej. desde main)."""
+        with self._condicion:
+            if ocupacion is not None:
+                self.ocupacion = ocupacion
+            if espera_maxima is not None:
+                self.espera_maxima = espera_maxima
+
+    def iniciar(self):
+        with self._condicion:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._bucle, name="despachador-capturas", daemon=True)
+                self._hilo.start()
+
+    def disparar(self):
+        """Registra una pulsación. Es seguro llamarlo desde los callbacks de pynput."""
+        with self._condicion:
+            if self._pendiente is not None:
+                self._agrupadas += 1
+            self._pendiente = time.time()
+            self._condicion.notify()
+
+    def _esperar_hueco(self):
+        """Espera el antirrebote y, si el pipeline está ocupado, a que se libere (con un máximo)."""
+        ahora = time.monotonic()
+        antirrebote = self._ultima_captura + self.intervalo_minimo - ahora
+        if antirrebote > 0:
+            time.sleep(antirrebote)
+        limite = self._ultima_captura + self.espera_maxima
+        espera = 0.02
+        while time.monotonic() < limite:
+            try:
+                if self.ocupacion() < self.max_en_curso:
+                    return
+            except Exception as e:
+                print(f"Error al consultar la ocupación del pipeline: {e}")
+                return
+            time.sleep(espera)
+            espera = min(espera * 2, 0.2)
+
+    def _bucle(self):
+        while True:
+            with self._condicion:
+                while self._pendiente is None:
+                    self._condicion.wait()
+
+            self._esperar_hueco()
+
+            # Tras la espera se atiende la pulsación más reciente; las anteriores se descartan
+            with self._condicion:
+                instante_disparo, self._pendiente = self._pendiente, None
+                agrupadas, self._agrupadas = self._agrupadas, 0
+            if agrupadas:
+                print(f"{agrupadas} pulsaciones agrupadas en una sola captura.")
+                registro_metricas.contador("tarca_disparos_agrupados_total",
+                                           "Pulsaciones agrupadas con otra más reciente").inc(agrupadas)
+
+            self._ultima_captura = time.monotonic()
+            try:
+                realizar_captura_pantalla(instante_disparo)
+            except Exception as e:
+                print(f"Error inesperado en el despachador de capturas: {e}")
 
-def resetear_cooldown_captura():
-    """Resetea la bandera captura_en_cooldown después del cooldown."""
-    global captura_en_cooldown
-    captura_en_cooldown = False
+despachador_disparos = DespachadorDisparos()
 
 def al_presionar_tecla(tecla):
     """Callback que se ejecuta cuando se presiona una tecla."""
-    global captura_en_cooldown
     try:
-        if tecla == keyboard.Key.f2 and not captura_en_cooldown:
-            captura_en_cooldown = True
-            threading.Thread(target=realizar_captura_pantalla).start()
+        if tecla == keyboard.Key.f2:
+            _disparos.inc(origen="teclado")
+            despachador_disparos.disparar()
     except Exception as e:
         print(f"Error en el callback de tecla: {e}")
+        registro_metricas.registrar_error("escucha_teclado", e)
 
 def al_hacer_clic_raton(x, y, button, pressed):
     """Callback que se ejecuta cuando se hace clic con el ratón."""
-    global captura_en_cooldown
     try:
-        if pressed and button == mouse.Button.x2 and not captura_en_cooldown:
-            captura_en_cooldown = True
-            threading.Thread(target=realizar_captura_pantalla).start()
+        if pressed and button == mouse.Button.x2:
+            _disparos.inc(origen="raton")
+            despachador_disparos.disparar()
     except Exception as e:
         print(f"Error en el callback de clic del ratón: {e}")
+        registro_metricas.registrar_error("escucha_raton", e)
 
 def iniciar_escucha_teclado():
     """Inicia el listener para la tecla F2."""
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+import os
+import threading
+import time
+
+# --- Configuración ---
+MAX_CONEXIONES = 10
+MAX_CONEXIONES_KEEPALIVE = 5
+KEEPALIVE_SEGUNDOS = 120  # Tiempo que una conexión ociosa se mantiene abierta en el pool
+
+_cliente = None
+_bloqueo_cliente = threading.Lock()
+_ultimo_uso = 0.0
+_tokens_hilo = threading.local()  # Tokens consumidos por cada hilo (informe del modo lote)
+
+def obtener_cliente():
+    """Devuelve el cliente de genai compartido por toda la aplicación, creándolo la primera vez."""
+    global _cliente
+    with _bloqueo_cliente:
+        if _cliente is None:
+            _cliente = _crear_cliente()
+            print("Cliente de Gemini inicializado.")
+        return _cliente
+
+def _crear_cliente():
+    """Crea el cliente con un pool de conexiones HTTP persistentes (keep-alive)."""
+    # Importaciones diferidas: google.genai es lento de cargar y no hace falta para arrancar
+    import httpx
+    from google import genai
+    from google.genai import types
+
+    limites = httpx.Limits(
+        max_connections=MAX_CONEXIONES,
+        max_keepalive_connections=MAX_CONEXIONES_KEEPALIVE,
+        keepalive_expiry=KEEPALIVE_SEGUNDOS,
+    )
+    opciones_http = types.HttpOptions(
+        client_args={"limits": limites},
+        async_client_args={"limits": limites},
+        # Permite apuntar a un servidor local (p. ej. el simulador de benchmark.py)
+        base_url=os.getenv("GEMINI_BASE_URL") or None,
+    )
+    # Si GEMINI_API_KEY no está definida, genai.Client busca la clave en el entorno por sí mismo.
+    return genai.Client(api_key=os.getenv("GEMINI_API_KEY"), http_options=opciones_http)
+
+def registrar_uso(respuesta=None):
+    """
+    Anota que el cliente acaba de usarse, para no calentar una conexión que ya está activa.
+    Si se pasa la respuesta, suma su usage_metadata a los tokens del hilo actual.
+    """
+    global _ultimo_uso
+    _ultimo_uso = time.monotonic()
+    sumar_tokens_al_hilo(uso_de_respuesta(respuesta))
+
+def uso_de_respuesta(respuesta):
+    """Tokens de entrada, salida y total de una respuesta (ceros si no trae usage_metadata)."""
+    uso = getattr(respuesta, "usage_metadata", None)
+    if not uso:
+        return {"entrada": 0, "salida": 0, "total": 0}
+    return {"entrada": uso.prompt_token_count or 0, "salida": uso.candidates_token_count or 0,
+            "total": uso.total_token_count or 0}
+
+def sumar_tokens_al_hilo(uso):
+    """Suma al hilo actual unos tokens medidos en otro (p. ej. en el bucle de eventos de MotorAsync)."""
+    tokens = tokens_del_hilo()
+    for clave in tokens:
+        tokens[clave] += uso.get(clave, 0)
+
+def reiniciar_tokens_del_hilo():
+    _tokens_hilo.contador = {"entrada": 0, "salida": 0, "total": 0}
+
+def tokens_del_hilo():
+    """Tokens acumulados por el hilo actual desde el último reiniciar_tokens_del_hilo()."""
+    if not hasattr(_tokens_hilo, "contador"):
+        reiniciar_tokens_del_hilo()
+    return _tokens_hilo.contador
+
+def calentar_conexion(modelo):
+    """Hace una petición ligera para abrir la conexión TLS y validar la autenticación."""
+    try:
+        obtener_cliente().models.get(model=modelo)
+        registrar_uso()
+        return True
+    except Exception as e:
+        print(f"No se pudo calentar la conexión con Gemini: {e}")
+        return False
+
+def iniciar_calentamiento(modelo, shutdown_event, intervalo_segundos=0):
+    """
+    Calienta la conexión en un hilo en segundo plano. Si se indica un intervalo, repite el
+    calentamiento mientras la aplicación esté ociosa para que el pool no cierre la conexión.
+    """
+    def _calentar():
+        calentar_conexion(modelo)
+        if intervalo_segundos <= 0:
+            return
+        while not shutdown_event.wait(intervalo_segundos):
+            if time.monotonic() - _ultimo_uso >= intervalo_segundos:
+                calentar_conexion(modelo)
+
+    hilo = threading.Thread(target=_calentar, daemon=True)
+    hilo.start()
+    return hilo
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+import os
+
+# Valores de texto que se interpretan como "activado" en las variables de entorno
+VALORES_VERDADEROS = ('true', '1', 't', 'y', 'yes')
+
+def leer_bool(nombre, por_defecto=False):
+    """Lee una variable de entorno booleana ('true', '1', 'yes'...)."""
+    valor = os.getenv(nombre)
+    if valor is None or not valor.strip():
+        return por_defecto
+    return valor.strip().lower() in VALORES_VERDADEROS
+
+def leer_int(nombre, por_defecto):
+    """Lee una variable de entorno entera; si no es válida usa el valor por defecto."""
+    valor = os.getenv(nombre)
+    if valor is None or not valor.strip():
+        return por_defecto
+    try:
+        return int(valor)
+    except ValueError:
+        print(f"Valor no válido para {nombre}: '{valor}'. Se usará {por_defecto}.")
+        return por_defecto
+
+def leer_float(nombre, por_defecto):
+    """Lee una variable de entorno decimal; si no es válida usa el valor por defecto."""
+    valor = os.getenv(nombre)
+    if valor is None or not valor.strip():
+        return por_defecto
+    try:
+        return float(valor)
+    except ValueError:
+        print(f"Valor no válido para {nombre}: '{valor}'. Se usará {por_defecto}.")
+        return por_defecto
+
+def leer_str(nombre, por_defecto=""):
+    """Lee una variable de entorno de texto, quitando espacios sobrantes."""
+    valor = os.getenv(nombre)
+    if valor is None or not valor.strip():
+        return por_defecto
+    return valor.strip()
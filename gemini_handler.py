@@ -1,99 +1,570 @@
 # -*- coding: utf-8 -*-
 import os
+import threading
 import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from watchdog.events import FileSystemEventHandler
 from PIL import Image
-from google.genai import types
-from ticker_display import update_ticker, reset_to_default_state, show_processing_state
 from dotenv import load_dotenv
-from prompts import PROMPT_PARA_GEMINI, PROMPT_PARA_GOOGLE_SEARCH
+from cliente_genai import obtener_cliente, registrar_uso
+from cache_respuestas import CacheRespuestas, calcular_huella, RUTA_CACHE_TEXTO
+from config import leer_bool, leer_int, leer_str
+from planificador import (
+    PlanificadorModelos, LimitadorTokens, RespuestaNoValida, leer_niveles, NIVELES_POR_DEFECTO
+)
+from preprocesado import ConfigPreprocesado, preprocesar_imagen, registro_cursores
+from ocr import LectorOCR
+from streaming import consultar_en_streaming
+from trazas import registro_trazas, id_captura_desde_ruta
+from metricas import registro_metricas
+from prompts import PROMPT_PARA_GEMINI, PROMPT_PARA_GEMINI_TEXTO, PROMPT_PARA_GOOGLE_SEARCH, es_respuesta_valida
 
 # --- Configuración ---
 MODELO_GEMINI = 'gemini-2.5-flash'
+MAX_ARCHIVOS_RECORDADOS = 1000  # Límite de rutas recordadas cuando no hay manifiesto de capturas
+MAX_METRICAS_STREAMING = 200
+EXTENSIONES_IMAGEN = ('.png', '.jpg', '.jpeg')
+# Espera hasta que un archivo externo deje de crecer (sondeo con retroceso exponencial)
+ESPERA_INICIAL_ARCHIVO = 0.01
+ESPERA_MAXIMA_ARCHIVO = 0.2
+TIEMPO_LIMITE_ARCHIVO = 5.0
+
+_consultas_cache = registro_metricas.contador("tarca_cache_consultas_total", "Consultas a las cachés de respuestas")
+_respuestas = registro_metricas.contador("tarca_respuestas_total", "Respuestas obtenidas del modelo por resultado")
+
+def tasa_aciertos_cache():
+    """Fracción de consultas a la caché de imágenes que acertaron (0 si aún no hubo ninguna)."""
+    aciertos = _consultas_cache.valor(cache="imagen", resultado="acierto")
+    total = aciertos + _consultas_cache.valor(cache="imagen", resultado="fallo")
+    return round(aciertos / total, 3) if total else 0.0
+
+registro_metricas.indicador("tarca_cache_tasa_aciertos", "Fracción de aciertos de la caché de imágenes",
+                            funcion=tasa_aciertos_cache)
 
 class ManejadorCapturas(FileSystemEventHandler):
     """Clase para manejar eventos del sistema de archivos (nuevas capturas)."""
-    def __init__(self):
-        self.archivos_procesados = set()  # Para evitar procesar un archivo múltiples veces
+    def __init__(self, cliente=None, almacen=None):
+        self.almacen = almacen  # AlmacenCapturas: manifiesto persistente de capturas procesadas
+        # El hash y la escritura del manifiesto se hacen fuera del hilo de inferencia
+        self._escritor_manifiesto = ThreadPoolExecutor(max_workers=1, thread_name_prefix="manifiesto") if almacen else None
+        self.archivos_procesados = OrderedDict()  # Sin almacén: rutas ya procesadas (acotado)
+        self._bloqueo_archivos = threading.Lock()
+        self.cliente = cliente  # Cliente de genai compartido; se crea al primer uso si no se pasa
+        self.google_handler = None
+        self.motor_async = None  # Motor de carrera entre Gemini y Google Search (CARRERA_MODELOS)
+        self.carrera_modelos = leer_bool("CARRERA_MODELOS")
+        self.streaming = leer_bool("STREAMING")  # Cierra el stream en cuanto llega la letra
+        self.metricas_streaming = deque(maxlen=MAX_METRICAS_STREAMING)
+        self.pipeline = None  # Si se asigna un PipelineCapturas, el procesamiento sale del hilo del observador
+        self.preprocesado = ConfigPreprocesado.desde_entorno()
+        self.planificador = self._crear_planificador() if leer_bool("PLANIFICADOR") else None
+        self.limitador = None  # LimitadorTokens opcional delante de cada consulta al modelo (modo lote)
+        self.cache = None
+        if leer_bool("CACHE_RESPUESTAS"):
+            # Solo acierta con capturas idénticas a una ya respondida (misma huella exacta)
+            self.cache = CacheRespuestas(
+                max_entradas=leer_int("CACHE_MAX_ENTRADAS", 256),
+                ttl_segundos=leer_int("CACHE_TTL_SEGUNDOS", 24 * 60 * 60),
+            )
+        # OCR local opcional: si el texto es fiable se consulta por texto en lugar de por imagen
+        self.ocr = LectorOCR.desde_entorno() if leer_bool("OCR") else None
+        self.cache_texto = None
+        if self.ocr:
+            self.cache_texto = CacheRespuestas(
+                ruta=RUTA_CACHE_TEXTO,
+                max_entradas=leer_int("CACHE_MAX_ENTRADAS", 256),
+                ttl_segundos=leer_int("CACHE_TTL_SEGUNDOS", 24 * 60 * 60),
+            )
+
+    @staticmethod
+    def _es_imagen(evento, ruta):
+        return not evento.is_directory and ruta.lower().endswith(EXTENSIONES_IMAGEN)
 
     def on_created(self, evento):
-        """Se llama cuando se crea un nuevo archivo en la carpeta monitoreada."""
-        if not evento.is_directory and evento.src_path.lower().endswith(('.png', '.jpg', '.jpeg')):
-            time.sleep(0.5)  # Pausa para asegurar que el archivo se haya escrito completamente
-            
-            if evento.src_path in self.archivos_procesados:
-                return  # Ya procesado o en proceso
+        """
+        Se llama cuando se crea un nuevo archivo en la carpeta monitoreada. El archivo puede
+        estar aún a medio escribir, así que se espera en otro hilo a que su tamaño se estabilice
+        (salvo que antes llegue on_closed).
+        """
+        if self._es_imagen(evento, evento.src_path):
+            threading.Thread(target=self._esperar_archivo_estable, args=(evento.src_path,), daemon=True).start()
 
-            self.archivos_procesados.add(evento.src_path)
-            print(f"\nNueva captura detectada: {evento.src_path}")
-            self.procesar_con_gemini(evento.src_path)    
+    def on_closed(self, evento):
+        """Se llama al cerrarse un archivo escrito (IN_CLOSE_WRITE, solo con inotify): ya está completo."""
+        if self._es_imagen(evento, evento.src_path):
+            self._archivo_listo(evento.src_path, "cierre")
 
-    def procesar_con_gemini(self, ruta_imagen):
-        """Envía la imagen a Gemini y muestra la respuesta."""
-        show_processing_state()
+    def on_moved(self, evento):
+        """Las capturas propias se escriben en un temporal y se renombran: al renombrarse ya están completas."""
+        if self._es_imagen(evento, evento.dest_path):
+            self._archivo_listo(evento.dest_path, "renombrado")
+
+    def _esperar_archivo_estable(self, ruta_imagen):
+        """Sondea el tamaño del archivo hasta que deja de cambiar, con esperas crecientes."""
+        espera = ESPERA_INICIAL_ARCHIVO
+        limite = time.monotonic() + TIEMPO_LIMITE_ARCHIVO
+        tamano_anterior = -1
+        while time.monotonic() < limite:
+            if self._archivo_registrado(ruta_imagen):
+                return  # Otro evento (cierre o renombrado) ya lo dio por listo
+            try:
+                tamano = os.path.getsize(ruta_imagen)
+            except OSError:
+                return  # El archivo ha desaparecido (p. ej. era temporal)
+            if tamano > 0 and tamano == tamano_anterior:
+                self._archivo_listo(ruta_imagen, "tamaño estable")
+                return
+            tamano_anterior = tamano
+            time.sleep(espera)
+            espera = min(espera * 2, ESPERA_MAXIMA_ARCHIVO)
+        print(f"El archivo '{ruta_imagen}' no terminó de escribirse en {TIEMPO_LIMITE_ARCHIVO} s; se procesa igualmente.")
+        self._archivo_listo(ruta_imagen, "tiempo límite")
+
+    def _archivo_listo(self, ruta_imagen, motivo):
+        """Entrega una captura completa al pipeline, una sola vez por archivo."""
+        if not self._registrar_archivo(ruta_imagen):
+            return  # Ya procesado o en proceso
+
+        print(f"\nNueva captura detectada ({motivo}): {ruta_imagen}")
+        traza = registro_trazas.obtener(id_captura_desde_ruta(ruta_imagen))
+        traza.marcar_desde_ultimo("deteccion", motivo=motivo)  # Desde que se escribió el PNG
+        if self.pipeline:
+            self.pipeline.enviar(ruta_imagen, traza)
+        else:
+            self.procesar_con_gemini(ruta_imagen)
+
+    def _archivo_registrado(self, ruta_imagen):
+        if self.almacen:
+            return self.almacen.contiene(ruta_imagen)
+        with self._bloqueo_archivos:
+            return ruta_imagen in self.archivos_procesados
+
+    def _registrar_archivo(self, ruta_imagen):
+        """Registra la ruta como procesada. Devuelve False si ya lo estaba."""
+        if self.almacen:
+            return self.almacen.registrar(ruta_imagen)
+        with self._bloqueo_archivos:
+            if ruta_imagen in self.archivos_procesados:
+                return False
+            self.archivos_procesados[ruta_imagen] = True
+            while len(self.archivos_procesados) > MAX_ARCHIVOS_RECORDADOS:
+                self.archivos_procesados.popitem(last=False)
+            return True
+
+    def _olvidar_archivo(self, ruta_imagen):
+        """Permite reprocesar un archivo tras un error (las capturas en memoria no se registran)."""
+        if not isinstance(ruta_imagen, str):
+            return
+        if self.almacen:
+            self.almacen.olvidar(ruta_imagen)
+        else:
+            with self._bloqueo_archivos:
+                self.archivos_procesados.pop(ruta_imagen, None)
+
+    def procesar_captura(self, captura):
+        """Procesa una captura recibida en memoria, sin pasar por la carpeta de capturas."""
+        print(f"\nNueva captura en memoria: {captura.timestamp:%H:%M:%S.%f}")
+        if self.pipeline:
+            self.pipeline.enviar(captura)
+        else:
+            self.procesar_con_gemini(captura)
+
+    def _obtener_cliente(self):
+        """Devuelve el cliente compartido de Gemini o None si no se puede inicializar."""
+        if self.cliente is None:
+            try:
+                self.cliente = obtener_cliente()
+            except Exception as e:
+                print(f"Error al inicializar el cliente de Gemini: {e}")
+                return None
+        return self.cliente
+
+    def _obtener_google_handler(self):
+        """Crea una única vez el manejador de Google Search sobre el cliente compartido."""
+        if self.google_handler is None:
+            from google_search_handler import GoogleSearchHandler
+            self.google_handler = GoogleSearchHandler(self.cliente, streaming=self.streaming)
+        return self.google_handler
+
+    def _obtener_motor_async(self):
+        """Crea una única vez el motor asyncio sobre el cliente compartido."""
+        if self.motor_async is None:
+            from motor_async import MotorAsync
+            self.motor_async = MotorAsync(self.cliente, MODELO_GEMINI, streaming=self.streaming)
+        return self.motor_async
+
+    @staticmethod
+    def nombre_origen(origen):
+        """Nombre legible de una captura para los mensajes de consola."""
+        return os.path.basename(origen) if isinstance(origen, str) else "captura en memoria"
+
+    @staticmethod
+    def ruta_origen(origen):
+        """Ruta en disco de una captura (las capturas en memoria llevan la ruta donde se guardan)."""
+        return origen if isinstance(origen, str) else getattr(origen, "ruta", None)
+
+    def cargar_imagen(self, origen):
+        """
+        Devuelve una imagen de PIL a partir de una ruta en disco, una captura en memoria
+        o una imagen ya cargada. Devuelve None si no se puede cargar.
+        """
+        try:
+            if isinstance(origen, str):
+                return Image.open(origen)
+            if hasattr(origen, "a_imagen_pil"):
+                return origen.a_imagen_pil()
+            return origen
+        except FileNotFoundError:
+            print(f"Error: Archivo de imagen no encontrado durante el procesamiento: {origen}")
+        except Exception as e:
+            print(f"Error al abrir la imagen '{self.nombre_origen(origen)}': {e}")
+        self._olvidar_archivo(origen)
+        return None
+
+    def preparar_imagen(self, imagen, origen=None):
+        """
+        Aplica el preprocesado configurado (recorte, reducción, recodificación).
+        Devuelve (imagen_procesada, contenido_para_el_modelo).
+        """
+        if not self.preprocesado.activo:
+            return imagen, imagen
+        try:
+            cursor = getattr(origen, "cursor", None)
+            if cursor is None and isinstance(origen, str):
+                cursor = registro_cursores.extraer(origen)  # Captura guardada por el modo con carpeta
+            imagen_procesada, contenido, estadisticas = preprocesar_imagen(imagen, self.preprocesado, cursor)
+            print(f"Preprocesado de '{self.nombre_origen(origen)}': {estadisticas}")
+            return imagen_procesada, contenido
+        except Exception as e:
+            print(f"Error en el preprocesado, se envía la imagen original: {e}")
+            return imagen, imagen
+
+    def obtener_respuesta(self, imagen, nombre_imagen="captura", ruta_imagen=None, contenido=None):
+        """
+        Obtiene la respuesta para una imagen ya cargada, primero de la caché y si no del modelo.
+        Si se pasa 'contenido' (imagen ya recodificada), es lo que se envía al modelo.
+        No toca la bandeja del sistema; devuelve el texto de la respuesta o None si falla.
+        """
+        inicio = time.perf_counter()
+        hash_imagen = None
+        if self.cache:
+            # Solo la caché necesita el hash antes de llamar al modelo
+            hash_imagen = self._calcular_hash(imagen if contenido is None else contenido)
+
+        respuesta = self._resolver_respuesta(imagen, nombre_imagen, ruta_imagen, contenido, hash_imagen)
+        if respuesta and self._escritor_manifiesto and ruta_imagen:
+            latencia_ms = (time.perf_counter() - inicio) * 1000
+            self._escritor_manifiesto.submit(self._anotar_en_manifiesto, ruta_imagen, hash_imagen,
+                                             imagen if contenido is None else contenido, respuesta, latencia_ms)
+        return respuesta
+
+    @staticmethod
+    def _calcular_hash(contenido):
+        try:
+            return calcular_huella(contenido)
+        except Exception as e:
+            print(f"Error al calcular el hash de la captura: {e}")
+            registro_metricas.registrar_error("cache", e)
+            return None
+
+    def _anotar_en_manifiesto(self, ruta_imagen, hash_imagen, contenido, respuesta, latencia_ms):
+        """Guarda el resultado en el manifiesto; calcula aquí el hash si la caché no lo hizo."""
+        if hash_imagen is None:
+            hash_imagen = self._calcular_hash(contenido)
+        try:
+            self.almacen.guardar_resultado(ruta_imagen, hash_imagen, respuesta, latencia_ms)
+        except Exception as e:
+            print(f"Error al actualizar el manifiesto de capturas: {e}")
+
+    def _resolver_respuesta(self, imagen, nombre_imagen, ruta_imagen, contenido, hash_imagen):
+        """Consulta la caché y, si no hay acierto, la ruta de modelo configurada."""
+        contenido = imagen if contenido is None else contenido
+
+        # Si exactamente la misma captura ya se respondió, no se llama al modelo
+        if self.cache and hash_imagen is not None:
+            try:
+                respuesta_cacheada = self.cache.buscar(hash_imagen)
+            except Exception as e:
+                print(f"Error al consultar la caché de respuestas: {e}")
+                registro_metricas.registrar_error("cache", e)
+                respuesta_cacheada = None
+            _consultas_cache.inc(cache="imagen", resultado="acierto" if respuesta_cacheada else "fallo")
+            if respuesta_cacheada:
+                print(f"Respuesta obtenida de la caché para '{nombre_imagen}': {respuesta_cacheada}")
+                return respuesta_cacheada
+
+        if self.ocr:
+            lectura = self._leer_texto(imagen, nombre_imagen)
+            if lectura:
+                textoRespuesta = self._resolver_por_texto(lectura, nombre_imagen, hash_imagen)
+                if textoRespuesta:
+                    return textoRespuesta
 
-        GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+        if not self._obtener_cliente():
+            print("API Key de Gemini sigue sin encontrarse.")
+            self._olvidar_archivo(ruta_imagen)
+            return None
+        if self.limitador:
+            self.limitador.adquirir()
+
+        with registro_metricas.medir_llamada(self._ruta_modelo()):
+            textoRespuesta = self._consultar_modelo(nombre_imagen, ruta_imagen, contenido, hash_imagen)
+        _respuestas.inc(ruta=self._ruta_modelo(), resultado="ok" if textoRespuesta else "sin_respuesta")
+        return textoRespuesta
+
+    def _ruta_modelo(self):
+        """Nombre de la ruta de modelo configurada (etiqueta de las métricas)."""
+        if self.planificador:
+            return "planificador"
+        if self.carrera_modelos:
+            return "carrera"
+        if os.getenv("GOOGLE_SEARCH", "false").lower() == "true":
+            return "busqueda"
+        return "streaming" if self.streaming else "gemini"
+
+    def _consultar_modelo(self, nombre_imagen, ruta_imagen, contenido, hash_imagen):
+        """Envía la captura por la ruta configurada: planificador, carrera, Google Search, streaming o directa."""
         GOOGLE_SEARCH = os.getenv ("GOOGLE_SEARCH", "false").lower()    
-        
+
+        if self.planificador:
+            print(f"Enviando '{nombre_imagen}' con el planificador ({', '.join(map(str, self.planificador.niveles))})...")
+            textoRespuesta, _ = self.planificador.ejecutar(
+                lambda nivel, timeout_ms: self._consultar_nivel(nivel, contenido, nombre_imagen, timeout_ms)
+            )
+            if not textoRespuesta:
+                print("Ningún nivel de modelo devolvió una respuesta a tiempo.")
+                self._olvidar_archivo(ruta_imagen)
+                return None
+            self._guardar_en_cache(hash_imagen, textoRespuesta)
+            return textoRespuesta
+
+        if self.carrera_modelos:
+            print(f"Enviando '{nombre_imagen}' a Gemini y a Google Search en paralelo...")
+            # Sin plazo, una petición colgada dejaría bloqueado un hilo de inferencia
+            plazo_s = leer_int("PRESUPUESTO_LATENCIA_MS", 10000) / 1000
+            textoRespuesta, _, metricas = self._obtener_motor_async().resolver(contenido, timeout=plazo_s)
+            if metricas:
+                self.registrar_metricas_streaming(nombre_imagen, metricas)
+            if not textoRespuesta:
+                print("Ninguna ruta devolvió una respuesta válida.")
+                self._olvidar_archivo(ruta_imagen)
+                return None
+            self._guardar_en_cache(hash_imagen, textoRespuesta)
+            return textoRespuesta
+
         if GOOGLE_SEARCH == "true":
-            from google_search_handler import GoogleSearchHandler
-            
-            google_handler = GoogleSearchHandler()
-            textoRespuesta = google_handler.process_image(
-                ruta_imagen, PROMPT_PARA_GOOGLE_SEARCH, MODELO_GEMINI
+            textoRespuesta, metricas = self._obtener_google_handler().process_image(
+                contenido, PROMPT_PARA_GOOGLE_SEARCH, MODELO_GEMINI
             )
+            if metricas:
+                self.registrar_metricas_streaming(nombre_imagen, metricas)
             
             if not textoRespuesta:
                 print("Google Search no devolvió contenido. Verifica la imagen o el prompt.")
-                reset_to_default_state()
-                return
+                return None
             
             print(textoRespuesta)
-            update_ticker(textoRespuesta.strip())
-        else:        
-            import google.generativeai as genai
+            self._guardar_en_cache(hash_imagen, textoRespuesta.strip())
+            return textoRespuesta.strip()
+
+        if self.streaming:
+            return self._obtener_respuesta_streaming(contenido, nombre_imagen, ruta_imagen, hash_imagen)
+
+        try:
+            print(f"Enviando '{nombre_imagen}' a Gemini...")
+            respuesta = self.cliente.models.generate_content(
+                model=MODELO_GEMINI,
+                contents=[PROMPT_PARA_GEMINI, contenido],
+            )
+            registrar_uso(respuesta)
             
-            if GEMINI_API_KEY:
-                try:
-                    genai.configure(api_key=GEMINI_API_KEY)
-                    self.modelo_gemini = genai.GenerativeModel(MODELO_GEMINI)
-                    print("Modelo Gemini inicializado.")
-                except Exception as e:
-                    print(f"Error al re-inicializar modelo Gemini: {e}")
-                    self.archivos_procesados.discard(ruta_imagen)
-                    reset_to_default_state()
-                    return
+            if not respuesta.candidates or not respuesta.text:
+                razon_bloqueo = "No especificada"
+                if respuesta.prompt_feedback and respuesta.prompt_feedback.block_reason:
+                    razon_bloqueo = respuesta.prompt_feedback.block_reason
+                    print(f"La solicitud a Gemini fue bloqueada. Razón: {razon_bloqueo}")
+                    registro_metricas.registrar_error("gemini", "bloqueada")
+                    if respuesta.prompt_feedback.safety_ratings:
+                        for rating in respuesta.prompt_feedback.safety_ratings:
+                            print(f"  Categoría de seguridad: {rating.category}, Probabilidad: {rating.probability}")
+                else:
+                    print("Gemini no devolvió contenido. Verifica la imagen o el prompt.")
+                return None
+            
+            self._guardar_en_cache(hash_imagen, respuesta.text.strip())
+            return respuesta.text.strip()
+        except Exception as e:
+            print(f"Error al procesar con Gemini: {e}")
+            registro_metricas.registrar_error("gemini", e)
+            self._olvidar_archivo(ruta_imagen)
+            return None
+
+    def _leer_texto(self, imagen, nombre_imagen):
+        """Pasada de OCR local. Devuelve un ResultadoOCR fiable o None para enviar la imagen."""
+        try:
+            lectura = self.ocr.leer(imagen)
+        except Exception as e:
+            print(f"Error en el OCR de '{nombre_imagen}', se envía la imagen: {e}")
+            registro_metricas.registrar_error("ocr", e)
+            return None
+        if lectura:
+            print(f"OCR de '{nombre_imagen}': {lectura}")
+        return lectura
+
+    def _resolver_por_texto(self, lectura, nombre_imagen, hash_imagen):
+        """
+        Busca el texto reconocido en la caché de texto y, si no está, pregunta al modelo solo con
+        el texto. Devuelve None si no hay respuesta válida, para recurrir a la imagen.
+        """
+        try:
+            respuesta_cacheada = self.cache_texto.buscar(lectura.clave)
+        except Exception as e:
+            print(f"Error al consultar la caché de texto: {e}")
+            registro_metricas.registrar_error("cache", e)
+            respuesta_cacheada = None
+        _consultas_cache.inc(cache="texto", resultado="acierto" if respuesta_cacheada else "fallo")
+        if respuesta_cacheada:
+            print(f"Respuesta obtenida de la caché de texto para '{nombre_imagen}': {respuesta_cacheada}")
+            self._guardar_en_cache(hash_imagen, respuesta_cacheada)
+            return respuesta_cacheada
+
+        if not self._obtener_cliente():
+            return None
+        if self.limitador:
+            self.limitador.adquirir()
+
+        with registro_metricas.medir_llamada("texto"):
+            if self.planificador:
+                print(f"Enviando el texto de '{nombre_imagen}' con el planificador...")
+                textoRespuesta, _ = self.planificador.ejecutar(
+                    lambda nivel, timeout_ms: self._consultar_nivel(
+                        nivel, lectura.texto, nombre_imagen, timeout_ms, prompt=PROMPT_PARA_GEMINI_TEXTO
+                    )
+                )
             else:
-                print("API Key de Gemini sigue sin encontrarse.")
-                self.archivos_procesados.discard(ruta_imagen)
-                reset_to_default_state()
-                return
+                textoRespuesta = self._consultar_texto(lectura.texto, nombre_imagen)
+        _respuestas.inc(ruta="texto", resultado="ok" if es_respuesta_valida(textoRespuesta) else "sin_respuesta")
 
-            try:
-                print(f"Enviando '{os.path.basename(ruta_imagen)}' a Gemini...")
-                imagen = Image.open(ruta_imagen)
-                respuesta = self.modelo_gemini.generate_content([PROMPT_PARA_GEMINI, imagen])
-                
-                if not respuesta.parts:
-                    razon_bloqueo = "No especificada"
-                    if hasattr(respuesta, 'prompt_feedback') and respuesta.prompt_feedback.block_reason:
-                        razon_bloqueo = respuesta.prompt_feedback.block_reason
-                        print(f"La solicitud a Gemini fue bloqueada. Razón: {razon_bloqueo}")
-                        if respuesta.prompt_feedback.safety_ratings:
-                            for rating in respuesta.prompt_feedback.safety_ratings:
-                                print(f"  Categoría de seguridad: {rating.category}, Probabilidad: {rating.probability}")
-                    else:
-                        print("Gemini no devolvió contenido. Verifica la imagen o el prompt.")
-                    reset_to_default_state()
-                    return
-                
-                update_ticker(respuesta.text.strip())
-            except FileNotFoundError:
-                print(f"Error: Archivo de imagen no encontrado durante el procesamiento: {ruta_imagen}")
-                self.archivos_procesados.discard(ruta_imagen)
-                reset_to_default_state()
-            except Exception as e:
-                print(f"Error al procesar con Gemini: {e}")
-                if ruta_imagen in self.archivos_procesados:
-                    self.archivos_procesados.discard(ruta_imagen)
-                reset_to_default_state()
+        if not es_respuesta_valida(textoRespuesta):
+            print(f"La consulta por texto de '{nombre_imagen}' no dio una respuesta válida; se envía la imagen.")
+            return None
+        textoRespuesta = textoRespuesta.strip()
+        self.cache_texto.guardar(lectura.clave, textoRespuesta)
+        self._guardar_en_cache(hash_imagen, textoRespuesta)
+        return textoRespuesta
+
+    def _consultar_texto(self, texto, nombre_imagen):
+        """Consulta Gemini con la variante de solo texto del prompt. Devuelve el texto o None."""
+        contenidos = [PROMPT_PARA_GEMINI_TEXTO, texto]
+        try:
+            print(f"Enviando el texto de '{nombre_imagen}' a Gemini ({len(texto)} caracteres)...")
+            if self.streaming:
+                textoRespuesta, metricas = consultar_en_streaming(self.cliente, MODELO_GEMINI, contenidos)
+                self.registrar_metricas_streaming(nombre_imagen, metricas)
+                return textoRespuesta
+            respuesta = self.cliente.models.generate_content(model=MODELO_GEMINI, contents=contenidos)
+            registrar_uso(respuesta)
+            return (respuesta.text or "").strip() if respuesta.candidates else None
+        except Exception as e:
+            print(f"Error al consultar Gemini con el texto: {e}")
+            registro_metricas.registrar_error("gemini", e)
+            return None
+
+    @staticmethod
+    def _crear_planificador():
+        """Construye el planificador de peticiones a partir de la configuración del entorno."""
+        niveles = leer_niveles(leer_str("MODELOS_RESPALDO", NIVELES_POR_DEFECTO))
+        peticiones_por_minuto = leer_int("LIMITE_PETICIONES_MINUTO", 0)
+        limitador = None
+        if peticiones_por_minuto > 0:
+            limitador = LimitadorTokens(peticiones_por_minuto, leer_int("RAFAGA_PETICIONES", 0) or None)
+        return PlanificadorModelos(
+            niveles,
+            limitador=limitador,
+            max_reintentos=leer_int("MAX_REINTENTOS", 2),
+            presupuesto_ms=leer_int("PRESUPUESTO_LATENCIA_MS", 10000),
+            timeout_nivel_ms=leer_int("TIMEOUT_NIVEL_MS", 0),
+        )
+
+    def _consultar_nivel(self, nivel, contenido, nombre_imagen, timeout_ms, prompt=None):
+        """
+        Una consulta al modelo de un nivel del planificador. A diferencia de las otras rutas,
+        deja pasar las excepciones para que el planificador decida si reintentar o cambiar de nivel.
+        Si no se indica 'prompt', se usa el de imagen que corresponde al nivel.
+        """
+        from google.genai import types
+        config = types.GenerateContentConfig(
+            tools=[types.Tool(google_search=types.GoogleSearch())] if nivel.busqueda else None,
+            http_options=types.HttpOptions(timeout=max(timeout_ms, 1)),
+        )
+        prompt = prompt or (PROMPT_PARA_GOOGLE_SEARCH if nivel.busqueda else PROMPT_PARA_GEMINI)
+        if self.streaming:
+            textoRespuesta, metricas = consultar_en_streaming(self.cliente, nivel.modelo, [prompt, contenido], config)
+            self.registrar_metricas_streaming(nombre_imagen, metricas)
+        else:
+            respuesta = self.cliente.models.generate_content(model=nivel.modelo, contents=[prompt, contenido], config=config)
+            registrar_uso(respuesta)
+            textoRespuesta = (respuesta.text or "").strip() if respuesta.candidates else ""
+        if not es_respuesta_valida(textoRespuesta):
+            raise RespuestaNoValida(repr(textoRespuesta))
+        return textoRespuesta.strip()
+
+    def _obtener_respuesta_streaming(self, contenido, nombre_imagen, ruta_imagen, hash_imagen):
+        """Consulta Gemini en streaming y devuelve la respuesta en cuanto se completa la letra."""
+        try:
+            print(f"Enviando '{nombre_imagen}' a Gemini (streaming)...")
+            textoRespuesta, metricas = consultar_en_streaming(
+                self.cliente, MODELO_GEMINI, [PROMPT_PARA_GEMINI, contenido]
+            )
+            self.registrar_metricas_streaming(nombre_imagen, metricas)
+            if not textoRespuesta:
+                print("Gemini no devolvió una respuesta válida en el stream.")
+                return None
+            self._guardar_en_cache(hash_imagen, textoRespuesta)
+            return textoRespuesta
+        except Exception as e:
+            print(f"Error al procesar con Gemini (streaming): {e}")
+            registro_metricas.registrar_error("gemini", e)
+            self._olvidar_archivo(ruta_imagen)
+            return None
+
+    def registrar_metricas_streaming(self, nombre_imagen, metricas):
+        """Guarda los tiempos hasta el primer token y hasta la respuesta de una petición."""
+        self.metricas_streaming.append(dict(metricas, captura=nombre_imagen))
+        print(f"Streaming '{nombre_imagen}': primer token en {metricas['ttft_ms']} ms, "
+              f"respuesta en {metricas['respuesta_ms']} ms.")
+
+    def procesar_con_gemini(self, ruta_imagen):
+        """Envía la imagen (ruta, captura en memoria o imagen de PIL) a Gemini y muestra la respuesta."""
+        # La bandeja (pystray) necesita escritorio; el modo lote no pasa por aquí
+        from ticker_display import update_ticker, reset_to_default_state, show_processing_state
+
+        show_processing_state()
+        imagen = self.cargar_imagen(ruta_imagen)
+        if imagen is None:
+            reset_to_default_state()
+            return
+
+        imagen, contenido = self.preparar_imagen(imagen, ruta_imagen)
+        respuesta = self.obtener_respuesta(
+            imagen, self.nombre_origen(ruta_imagen), self.ruta_origen(ruta_imagen), contenido
+        )
+        if respuesta:
+            update_ticker(respuesta)
+        else:
+            reset_to_default_state()
+
+    def cerrar(self):
+        """Libera los recursos en segundo plano del manejador."""
+        if self.motor_async:
+            self.motor_async.cerrar()
+        if self._escritor_manifiesto:
+            self._escritor_manifiesto.shutdown(wait=True)  # Termina las anotaciones pendientes
+        if self.almacen:
+            self.almacen.cerrar()
+
+    def _guardar_en_cache(self, hash_imagen, respuesta):
+        """Guarda la respuesta en la caché, si está activa y se pudo calcular el hash."""
+        if self.cache and hash_imagen is not None:
+            self.cache.guardar(hash_imagen, respuesta)
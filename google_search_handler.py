@@ -1,31 +1,57 @@
 # -*- coding: utf-8 -*-
+import time
 from google.genai import types
-from google import genai
 from PIL import Image
 
+from cliente_genai import obtener_cliente, registrar_uso
+from streaming import consultar_en_streaming
 from prompts import PROMPT_PARA_GOOGLE_SEARCH
+from metricas import registro_metricas
+
+_peticiones = registro_metricas.contador("tarca_busqueda_peticiones_total", "Peticiones con Google Search por resultado")
+_ultima_latencia = registro_metricas.indicador("tarca_busqueda_ultima_latencia_ms",
+                                               "Latencia de la última petición con Google Search")
 
 class GoogleSearchHandler:
-    def __init__(self):
-        self.client = genai.Client()
+    def __init__(self, client=None, streaming=False):
+        # Reutiliza el cliente compartido para aprovechar las conexiones ya abiertas
+        self.client = client or obtener_cliente()
         self.grounding_tool = types.Tool(
             google_search=types.GoogleSearch()
         )
         self.config = types.GenerateContentConfig(
             tools=[self.grounding_tool]
         )
+        self.streaming = streaming
 
     def process_image(self, ruta_imagen, prompt, modelo):
+        """
+        Devuelve (texto, metricas). Las métricas son los tiempos de esta petición en streaming
+        (None sin streaming); se devuelven en lugar de guardarse en el manejador porque varios
+        hilos lo comparten.
+        """
+        inicio = time.perf_counter()
+        texto, metricas = self._process_image(ruta_imagen, prompt, modelo)
+        _ultima_latencia.fijar(round((time.perf_counter() - inicio) * 1000, 1))
+        _peticiones.inc(resultado="ok" if texto else "sin_respuesta")
+        return texto, metricas
+
+    def _process_image(self, ruta_imagen, prompt, modelo):
         try:
-            imagen = Image.open(ruta_imagen)
+            # Acepta tanto una ruta en disco como una imagen ya cargada en memoria
+            imagen = Image.open(ruta_imagen) if isinstance(ruta_imagen, str) else ruta_imagen
+            if self.streaming:
+                return consultar_en_streaming(self.client, modelo, [prompt, imagen], self.config)
             respuesta = self.client.models.generate_content(
                 model=modelo,
                 contents=[prompt, imagen],
                 config=self.config,
             )
+            registrar_uso(respuesta)
             if not respuesta or not respuesta.candidates[0].content.parts[0]:
-                return None
-            return respuesta.candidates[0].content.parts[0].text.strip()
+                return None, None
+            return respuesta.candidates[0].content.parts[0].text.strip(), None
         except Exception as e:
             print(f"Error al procesar con Google Search: {e}")
-            return None
+            registro_metricas.registrar_error("busqueda", e)
+            return None, None
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Modo lote: procesa sin bandeja una carpeta de capturas ya existentes con el mismo camino
+de modelo que la aplicación y escribe un informe CSV o JSONL.
+
+    python lote.py capturas --salida resultados.csv --concurrencia 8 --peticiones-minuto 60
+    python main.py --lote capturas --salida resultados.jsonl
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from dotenv import load_dotenv
+from config import leer_int
+
+# --- Configuración ---
+SALIDA_POR_DEFECTO = "resultados_lote.csv"
+FORMATOS_SALIDA = ("csv", "jsonl")
+CAMPOS_SALIDA = ("archivo", "respuesta", "latencia_ms", "tokens_entrada", "tokens_salida",
+                 "tokens_total", "error", "instante")
+EXTENSIONES_IMAGEN = ('.png', '.jpg', '.jpeg')
+
+def listar_imagenes(carpeta):
+    """Imágenes de la carpeta (sin subcarpetas), en orden alfabético."""
+    return sorted(
+        nombre for nombre in os.listdir(carpeta)
+        if nombre.lower().endswith(EXTENSIONES_IMAGEN) and os.path.isfile(os.path.join(carpeta, nombre))
+    )
+
+def formato_de_salida(ruta, formato=None):
+    """Formato indicado o, si no, el que corresponde a la extensión del archivo de salida."""
+    formato = (formato or os.path.splitext(ruta)[1].lstrip(".")).lower()
+    return formato if formato in FORMATOS_SALIDA else "csv"
+
+def leer_informe(ruta, formato):
+    """
+    Filas de un informe anterior, solo la última de cada archivo (para reanudar el lote).
+    Devuelve None si el informe existe pero no se puede leer.
+    """
+    if not os.path.exists(ruta):
+        return {}
+    ultimas = {}
+    try:
+        with open(ruta, "r", encoding="utf-8", newline="") as f:
+            if formato == "jsonl":
+                filas = (json.loads(linea) for linea in f if linea.strip())
+            else:
+                filas = csv.DictReader(f)
+            for fila in filas:
+                ultimas[fila["archivo"]] = fila
+    except Exception as e:
+        print(f"No se pudo leer el informe anterior '{ruta}' ({e}); se procesa todo el lote.")
+        return None
+    return ultimas
+
+def reescribir_informe(ruta, formato, filas):
+    """Deja en el informe solo 'filas' (archivo temporal + reemplazo)."""
+    ruta_temporal = f"{ruta}.tmp"
+    with open(ruta_temporal, "w", encoding="utf-8", newline="") as f:
+        if formato == "csv":
+            escritor = csv.DictWriter(f, fieldnames=CAMPOS_SALIDA, extrasaction="ignore")
+            escritor.writeheader()
+            escritor.writerows(filas)
+        else:
+            for fila in filas:
+                f.write(json.dumps(fila, ensure_ascii=False) + "\n")
+    os.replace(ruta_temporal, ruta)
+
+class EscritorInforme:
+    """Añade una fila por captura al informe y la vuelca enseguida, para poder reanudar tras un corte."""
+    def __init__(self, ruta, formato):
+        self.formato = formato
+        escribir_cabecera = not os.path.exists(ruta) or os.path.getsize(ruta) == 0
+        self._archivo = open(ruta, "a", encoding="utf-8", newline="")
+        self._csv = None
+        if formato == "csv":
+            self._csv = csv.DictWriter(self._archivo, fieldnames=CAMPOS_SALIDA)
+            if escribir_cabecera:
+                self._csv.writeheader()
+
+    def escribir(self, fila):
+        if self._csv:
+            self._csv.writerow(fila)
+        else:
+            self._archivo.write(json.dumps(fila, ensure_ascii=False) + "\n")
+        self._archivo.flush()
+
+    def cerrar(self):
+        self._archivo.close()
+
+def procesar_imagen(manejador, carpeta, nombre):
+    """Procesa una captura y devuelve su fila del informe."""
+    from cliente_genai import reiniciar_tokens_del_hilo, tokens_del_hilo
+
+    reiniciar_tokens_del_hilo()
+    inicio = time.perf_counter()
+    respuesta, error = None, ""
+    try:
+        ruta_imagen = os.path.join(carpeta, nombre)
+        imagen = manejador.cargar_imagen(ruta_imagen)
+        if imagen is None:
+            error = "no_se_pudo_cargar"
+        else:
+            imagen, contenido = manejador.preparar_imagen(imagen, ruta_imagen)
+            # Sin ruta: el informe, no el manifiesto de capturas, es el registro del lote
+            respuesta = manejador.obtener_respuesta(imagen, nombre, None, contenido)
+            if not respuesta:
+                error = "sin_respuesta"
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    tokens = tokens_del_hilo()
+    return {
+        "archivo": nombre,
+        "respuesta": respuesta or "",
+        "latencia_ms": round((time.perf_counter() - inicio) * 1000, 1),
+        "tokens_entrada": tokens["entrada"],
+        "tokens_salida": tokens["salida"],
+        "tokens_total": tokens["total"],
+        "error": error,
+        "instante": datetime.now().isoformat(timespec="seconds"),
+    }
+
+def ejecutar_lote(carpeta, salida=SALIDA_POR_DEFECTO, formato=None, concurrencia=4,
+                  peticiones_por_minuto=0, rafaga=None, reanudar=True):
+    """
+    Procesa todas las imágenes de 'carpeta' con 'concurrencia' hilos y, si se indica,
+    como mucho 'peticiones_por_minuto' peticiones al modelo. Devuelve el resumen del lote.
+    """
+    from gemini_handler import ManejadorCapturas
+    from planificador import LimitadorTokens
+
+    formato = formato_de_salida(salida, formato)
+    imagenes = listar_imagenes(carpeta)
+    anteriores = leer_informe(salida, formato)
+    procesados = {archivo for archivo, fila in (anteriores or {}).items() if fila.get("respuesta")} if reanudar else set()
+    pendientes = [nombre for nombre in imagenes if nombre not in procesados]
+    if procesados:
+        print(f"Reanudando: {len(imagenes) - len(pendientes)} de {len(imagenes)} capturas ya tienen respuesta en '{salida}'.")
+    resumen = {"total": len(pendientes), "respondidas": 0, "errores": 0, "tokens_total": 0, "duracion_s": 0.0}
+    if not pendientes:
+        print("No hay capturas pendientes.")
+        return resumen
+    if anteriores:
+        # Las capturas que se van a repetir pierden su fila anterior: una sola fila por archivo
+        repetidas = set(pendientes)
+        reescribir_informe(salida, formato, [fila for archivo, fila in anteriores.items() if archivo not in repetidas])
+
+    manejador = ManejadorCapturas()
+    if peticiones_por_minuto > 0:
+        manejador.limitador = LimitadorTokens(peticiones_por_minuto, rafaga)
+    escritor = EscritorInforme(salida, formato)
+    print(f"Procesando {len(pendientes)} capturas de '{carpeta}' con {concurrencia} hilos...")
+    inicio = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, concurrencia), thread_name_prefix="lote") as ejecutor:
+            futuros = [ejecutor.submit(procesar_imagen, manejador, carpeta, nombre) for nombre in pendientes]
+            for completadas, futuro in enumerate(as_completed(futuros), start=1):
+                fila = futuro.result()
+                escritor.escribir(fila)
+                if fila["respuesta"]:
+                    resumen["respondidas"] += 1
+                else:
+                    resumen["errores"] += 1
+                resumen["tokens_total"] += fila["tokens_total"]
+                estado = fila["respuesta"] or f"ERROR ({fila['error']})"
+                print(f"[{completadas}/{len(pendientes)}] {fila['archivo']}: {estado} en {fila['latencia_ms']:.0f} ms")
+    except KeyboardInterrupt:
+        print("\nLote interrumpido; se reanudará desde la última captura escrita.")
+        raise
+    finally:
+        escritor.cerrar()
+        manejador.cerrar()
+        resumen["duracion_s"] = round(time.perf_counter() - inicio, 1)
+
+    print(f"Lote terminado en {resumen['duracion_s']} s: {resumen['respondidas']} respondidas, "
+          f"{resumen['errores']} errores, {resumen['tokens_total']} tokens. Informe: '{salida}'.")
+    return resumen
+
+def anadir_argumentos(parser, carpeta_posicional=False):
+    """Opciones del modo lote; main.py las comparte para 'main.py --lote CARPETA'."""
+    if carpeta_posicional:
+        parser.add_argument("lote", metavar="CARPETA", help="Carpeta con las capturas a procesar")
+    else:
+        parser.add_argument("--lote", metavar="CARPETA", help="Procesa sin bandeja las capturas de la carpeta y termina")
+    parser.add_argument("--salida", default=SALIDA_POR_DEFECTO, help="Informe .csv o .jsonl (se añaden filas)")
+    parser.add_argument("--formato", choices=FORMATOS_SALIDA, help="Formato del informe (por defecto, según la extensión)")
+    parser.add_argument("--concurrencia", type=int, default=None, help="Capturas en paralelo (LOTE_CONCURRENCIA)")
+    parser.add_argument("--peticiones-minuto", type=int, default=None,
+                        help="Límite de peticiones al modelo por minuto (LOTE_PETICIONES_MINUTO, 0 = sin límite)")
+    parser.add_argument("--rafaga", type=int, default=None, help="Peticiones seguidas permitidas antes de aplicar el límite")
+    parser.add_argument("--reprocesar", action="store_true", help="Ignora las respuestas que ya están en el informe")
+
+def ejecutar_desde_argumentos(args):
+    load_dotenv()
+    concurrencia = args.concurrencia if args.concurrencia is not None else leer_int("LOTE_CONCURRENCIA", 4)
+    peticiones_por_minuto = (args.peticiones_minuto if args.peticiones_minuto is not None
+                             else leer_int("LOTE_PETICIONES_MINUTO", 0))
+    try:
+        ejecutar_lote(args.lote, args.salida, args.formato, concurrencia, peticiones_por_minuto,
+                      args.rafaga, reanudar=not args.reprocesar)
+    except KeyboardInterrupt:
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description="TARCA en modo lote: responde una carpeta de capturas.")
+    anadir_argumentos(parser, carpeta_posicional=True)
+    ejecutar_desde_argumentos(parser.parse_args())
+
+if __name__ == "__main__":
+    main()
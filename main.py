@@ -1,21 +1,75 @@
 # -*- coding: utf-8 -*-
+import time
+INICIO_ARRANQUE = time.perf_counter()
+
+import argparse
 import os
+import queue
 import threading
 from dotenv import load_dotenv
-from watchdog.observers import Observer
-from captura_logic import iniciar_escucha_teclado, iniciar_escucha_raton
-from gemini_handler import ManejadorCapturas
-from ticker_display import initialize_ticker
+from cliente_genai import iniciar_calentamiento
+from config import leer_bool, leer_int, leer_float, leer_str
+from trazas import registro_trazas, RUTA_TRAZAS
+from metricas import registro_metricas, RUTA_INSTANTANEA
+from almacen_capturas import AlmacenCapturas, RUTA_MANIFIESTO, MAX_MB, MAX_DIAS
+from arranque import precargar_en_segundo_plano, informe_importaciones
+from lote import anadir_argumentos as anadir_argumentos_lote, ejecutar_desde_argumentos as ejecutar_lote
 
 # --- Configuración ---
 CAPTURE_FOLDER = "capturas"
+ETAPAS_EN_BANDEJA = ("total", "captura", "carga", "inferencia", "visualizacion")
+
+def consumir_capturas_en_memoria(cola_capturas, manejador, shutdown_event):
+    """Entrega al manejador las capturas recibidas en memoria hasta que se cierre la aplicación."""
+    while not shutdown_event.is_set():
+        try:
+            captura = cola_capturas.get(timeout=0.5)
+        except queue.Empty:
+            continue
+        manejador.procesar_captura(captura)
+
+def leer_argumentos():
+    parser = argparse.ArgumentParser(description="TARCA: responde preguntas de opción múltiple de la pantalla.")
+    parser.add_argument("--perfil-arranque", action="store_true",
+                        help="Muestra el coste de las importaciones (como -X importtime) y termina")
+    anadir_argumentos_lote(parser)
+    return parser.parse_args()
 
 def main():
+    args = leer_argumentos()
+    if args.perfil_arranque:
+        informe_importaciones()
+        return
+    if args.lote:
+        ejecutar_lote(args)  # Sin bandeja ni listeners: procesa la carpeta y termina
+        return
+
+    # La bandeja y los listeners necesitan escritorio: se importan solo fuera del modo lote
+    from captura_logic import (
+        iniciar_escucha_teclado, iniciar_escucha_raton, configurar_captura, cola_capturas, servicio_captura,
+        despachador_disparos, configurar_deteccion_cambios, COOLDOWN_CAPTURA_SEGUNDOS
+    )
+    from gemini_handler import ManejadorCapturas, MODELO_GEMINI
+    from pipeline import PipelineCapturas
+    from ticker_display import initialize_ticker, set_stats_provider, show_last_answer
+
     # Cargar variables de entorno del archivo .env (si existe)
     load_dotenv()
    
-    ninja_mode_default_str = os.getenv("NINJA_MODE_DEFAULT", "false").lower()
-    ninja_mode_initial_state = ninja_mode_default_str in ('true', '1', 't', 'y', 'yes')   
+    ninja_mode_initial_state = leer_bool("NINJA_MODE_DEFAULT")
+    captura_en_memoria = leer_bool("CAPTURA_EN_MEMORIA")
+    guardar_capturas = leer_bool("GUARDAR_CAPTURAS", True)
+    calentar_conexion = leer_bool("CALENTAR_CONEXION", True)
+    intervalo_calentamiento = leer_int("INTERVALO_CALENTAMIENTO_SEGUNDOS", 0)
+    hilos_inferencia = leer_int("HILOS_INFERENCIA", 2)
+    tamano_cola_pipeline = leer_int("TAMANO_COLA_PIPELINE", 4)
+    trazas_activas = leer_bool("TRAZAS")
+    estadisticas_en_bandeja = leer_bool("ESTADISTICAS_BANDEJA")
+    prerenderizar_iconos = leer_bool("PRERENDERIZAR_ICONOS", True)
+    precargar_modulos = leer_bool("PRECARGAR_MODULOS", True)
+    usar_almacen = leer_bool("ALMACEN_CAPTURAS", True)
+    puerto_metricas = leer_int("PUERTO_METRICAS", 0)  # 0 = sin servidor de métricas
+    ruta_metricas = leer_str("RUTA_METRICAS", RUTA_INSTANTANEA)  # Vacía = no se guarda al cerrar
 
     if not os.path.exists(CAPTURE_FOLDER):
         try:
@@ -25,25 +79,85 @@ def main():
             print(f"Error al crear la carpeta de capturas '{CAPTURE_FOLDER}': {e}")
             return
 
+    configurar_captura(en_memoria=captura_en_memoria, guardar_en_disco=guardar_capturas)
+    if puerto_metricas:
+        registro_metricas.iniciar_servidor(puerto_metricas)
+    if trazas_activas:
+        registro_trazas.configurar(leer_str("RUTA_TRAZAS", RUTA_TRAZAS))
+
     shutdown_event = threading.Event()
-    initialize_ticker(shutdown_event, ninja_mode_initial_state=ninja_mode_initial_state)
+    initialize_ticker(shutdown_event, ninja_mode_initial_state=ninja_mode_initial_state,
+                      prerender=prerenderizar_iconos)
+    if estadisticas_en_bandeja:
+        set_stats_provider(lambda: registro_trazas.texto_resumen(ETAPAS_EN_BANDEJA))
+
+    if calentar_conexion:
+        # Abre la conexión con Gemini mientras el usuario no ha capturado nada todavía
+        iniciar_calentamiento(MODELO_GEMINI, shutdown_event, intervalo_calentamiento)
+
+    # Un único hilo atiende las pulsaciones; el pipeline se conecta más abajo, cuando existe
+    despachador_disparos.configurar(espera_maxima=leer_float("COOLDOWN_CAPTURA_SEGUNDOS", COOLDOWN_CAPTURA_SEGUNDOS))
+    despachador_disparos.iniciar()
 
     hilo_escucha_teclado = threading.Thread(target=iniciar_escucha_teclado, daemon=True)
     hilo_escucha_teclado.start()
 
     hilo_escucha_raton = threading.Thread(target=iniciar_escucha_raton, daemon=True)
     hilo_escucha_raton.start()
+    print(f"Teclas de captura disponibles a los {(time.perf_counter() - INICIO_ARRANQUE) * 1000:.0f} ms del arranque.")
 
-    print(f"Las capturas se guardarán en la carpeta '{CAPTURE_FOLDER}'.")
-    manejador_eventos = ManejadorCapturas()
-    observador = Observer()
-    try:
-        observador.schedule(manejador_eventos, CAPTURE_FOLDER, recursive=False)
-        observador.start()
-        print(f"Monitoreando la carpeta '{CAPTURE_FOLDER}' para nuevas capturas...")
-    except Exception as e:
-        print(f"Error al iniciar el observador de archivos en '{CAPTURE_FOLDER}': {e}")
-        return
+    if precargar_modulos:
+        # Con la bandeja y las teclas ya activas, carga lo que necesitará la primera captura
+        precargar_en_segundo_plano()
+
+    almacen = None
+    if usar_almacen:
+        try:
+            almacen = AlmacenCapturas(
+                CAPTURE_FOLDER,
+                ruta_manifiesto=leer_str("ALMACEN_MANIFIESTO", RUTA_MANIFIESTO),
+                max_mb=leer_int("ALMACEN_MAX_MB", MAX_MB),  # 0 = sin poda por tamaño
+                max_dias=leer_int("ALMACEN_MAX_DIAS", MAX_DIAS),  # 0 = sin poda por antigüedad
+                compactar_tras_horas=leer_int("ALMACEN_COMPACTAR_TRAS_HORAS", 0),
+                calidad_compactado=leer_int("ALMACEN_CALIDAD_WEBP", 60),
+                lado_miniatura=leer_int("ALMACEN_LADO_MINIATURA", 0),
+            )
+            almacen.iniciar_poda(shutdown_event, leer_int("ALMACEN_INTERVALO_PODA_SEGUNDOS", 300))
+        except Exception as e:
+            print(f"Error al abrir el almacén de capturas, se usará un registro en memoria: {e}")
+            almacen = None
+
+    manejador_eventos = ManejadorCapturas(almacen=almacen)
+    pipeline = PipelineCapturas(manejador_eventos, hilos_inferencia, tamano_cola_pipeline)
+    manejador_eventos.pipeline = pipeline
+    pipeline.iniciar()
+    # El enfriamiento entre capturas depende de cuántas siguen pendientes o en proceso
+    despachador_disparos.configurar(ocupacion=lambda: pipeline.en_curso() + cola_capturas.qsize())
+    if leer_bool("DETECTAR_CAMBIOS"):
+        # Pantalla sin cambios: si la anterior sigue en proceso su respuesta ya llegará; si no, se repite
+        configurar_deteccion_cambios(
+            True, al_sin_cambios=lambda: pipeline.en_curso() + cola_capturas.qsize() > 0 or show_last_answer()
+        )
+    observador = None
+    if captura_en_memoria:
+        # Las capturas llegan directamente por la cola; el PNG (si se guarda) solo es un registro.
+        hilo_consumidor = threading.Thread(
+            target=consumir_capturas_en_memoria, args=(cola_capturas, manejador_eventos, shutdown_event), daemon=True
+        )
+        hilo_consumidor.start()
+        destino = f"y se guardarán en '{CAPTURE_FOLDER}'" if guardar_capturas else "sin guardarse en disco"
+        print(f"Modo en memoria: las capturas se envían directamente al modelo {destino}.")
+    else:
+        print(f"Las capturas se guardarán en la carpeta '{CAPTURE_FOLDER}'.")
+        from watchdog.observers import Observer  # Solo hace falta en el modo con carpeta
+        observador = Observer()
+        try:
+            observador.schedule(manejador_eventos, CAPTURE_FOLDER, recursive=False)
+            observador.start()
+            print(f"Monitoreando la carpeta '{CAPTURE_FOLDER}' para nuevas capturas...")
+        except Exception as e:
+            print(f"Error al iniciar el observador de archivos en '{CAPTURE_FOLDER}': {e}")
+            return
 
     try:
         shutdown_event.wait()
@@ -51,8 +165,18 @@ def main():
         print("\nCierre solicitado por el usuario (Ctrl+C)...")
     finally:
         print("Iniciando secuencia de apagado...")
-        observador.stop()
-        observador.join()
+        shutdown_event.set()
+        if observador:
+            observador.stop()
+            observador.join()
+        pipeline.detener()
+        manejador_eventos.cerrar()
+        servicio_captura.cerrar()
+        registro_trazas.escribir_resumen()
+        print(f"Resumen de latencias:\n{registro_trazas.texto_resumen()}")
+        registro_metricas.detener_servidor()
+        if ruta_metricas:
+            registro_metricas.escribir_instantanea(ruta_metricas)
         print("Aplicación detenida correctamente.")
 
 if __name__ == "__main__":
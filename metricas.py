@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# --- Configuración ---
+RUTA_INSTANTANEA = "metricas.json"
+HOST_METRICAS = "127.0.0.1"  # Solo accesible desde el propio equipo
+# Límites (ms) de los histogramas de latencia
+LIMITES_LATENCIA_MS = (50, 100, 250, 500, 1000, 2000, 5000, 10000, 30000)
+
+def _clave_etiquetas(etiquetas):
+    return tuple(sorted((nombre, str(valor)) for nombre, valor in etiquetas.items()))
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _formatear_etiquetas(clave, extra=()):
+    pares = list(clave) + list(extra)
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{nombre}="{_escapar(valor)}"' for nombre, valor in pares) + "}"
+
+def _formatear_valor(valor):
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+class Metrica:
+    tipo = ""
+
+    def __init__(self, nombre, ayuda, bloqueo):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self._bloqueo = bloqueo
+        self._valores = {}  # clave de etiquetas -> valor
+
+    def lineas_prometheus(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+        for clave, valor in self._muestras():
+            lineas.append(f"{self.nombre}{_formatear_etiquetas(clave)} {_formatear_valor(valor)}")
+        return lineas
+
+    def _muestras(self):
+        with self._bloqueo:
+            return sorted(self._valores.items())
+
+    def instantanea(self):
+        """Valores actuales: un número sin etiquetas o un diccionario 'etiqueta=valor,...' -> número."""
+        muestras = self._muestras()
+        if len(muestras) == 1 and not muestras[0][0]:
+            return muestras[0][1]
+        return {",".join(f"{n}={v}" for n, v in clave): valor for clave, valor in muestras}
+
+class Contador(Metrica):
+    """Valor que solo crece (peticiones, errores, aciertos de caché...)."""
+    tipo = "counter"
+
+    def inc(self, cantidad=1, **etiquetas):
+        clave = _clave_etiquetas(etiquetas)
+        with self._bloqueo:
+            self._valores[clave] = self._valores.get(clave, 0) + cantidad
+
+    def valor(self, **etiquetas):
+        with self._bloqueo:
+            return self._valores.get(_clave_etiquetas(etiquetas), 0)
+
+class Indicador(Metrica):
+    """Valor que sube y baja. Si se pasa 'funcion', se lee de ella en cada consulta (p. ej. qsize)."""
+    tipo = "gauge"
+
+    def __init__(self, nombre, ayuda, bloqueo, funcion=None):
+        super().__init__(nombre, ayuda, bloqueo)
+        self.funcion = funcion
+
+    def fijar(self, valor, **etiquetas):
+        with self._bloqueo:
+            self._valores[_clave_etiquetas(etiquetas)] = valor
+
+    def inc(self, cantidad=1, **etiquetas):
+        clave = _clave_etiquetas(etiquetas)
+        with self._bloqueo:
+            self._valores[clave] = self._valores.get(clave, 0) + cantidad
+
+    def dec(self, cantidad=1, **etiquetas):
+        self.inc(-cantidad, **etiquetas)
+
+    def _muestras(self):
+        if self.funcion is None:
+            return super()._muestras()
+        try:
+            return [((), self.funcion())]
+        except Exception:
+            return []
+
+class Histograma(Metrica):
+    """Distribución de valores (latencias) en intervalos acumulados, como los de Prometheus."""
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, bloqueo, limites=LIMITES_LATENCIA_MS):
+        super().__init__(nombre, ayuda, bloqueo)
+        self.limites = tuple(limites)
+
+    def observar(self, valor, **etiquetas):
+        clave = _clave_etiquetas(etiquetas)
+        with self._bloqueo:
+            datos = self._valores.get(clave)
+            if datos is None:
+                datos = self._valores[clave] = {"cubos": [0] * len(self.limites), "suma": 0.0, "cuenta": 0}
+            for i, limite in enumerate(self.limites):
+                if valor <= limite:
+                    datos["cubos"][i] += 1
+            datos["suma"] += valor
+            datos["cuenta"] += 1
+
+    def _muestras(self):
+        with self._bloqueo:
+            return sorted((clave, dict(datos, cubos=list(datos["cubos"]))) for clave, datos in self._valores.items())
+
+    def lineas_prometheus(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+        for clave, datos in self._muestras():
+            for limite, cuenta in zip(self.limites + (float("inf"),), datos["cubos"] + [datos["cuenta"]]):
+                lineas.append(f"{self.nombre}_bucket{_formatear_etiquetas(clave, [('le', _formatear_valor(limite))])} {cuenta}")
+            lineas.append(f"{self.nombre}_sum{_formatear_etiquetas(clave)} {_formatear_valor(datos['suma'])}")
+            lineas.append(f"{self.nombre}_count{_formatear_etiquetas(clave)} {datos['cuenta']}")
+        return lineas
+
+    def instantanea(self):
+        resultado = {}
+        for clave, datos in self._muestras():
+            etiquetas = ",".join(f"{n}={v}" for n, v in clave)
+            media = datos["suma"] / datos["cuenta"] if datos["cuenta"] else None
+            resultado[etiquetas] = {"cuenta": datos["cuenta"], "suma": round(datos["suma"], 1),
+                                    "media": round(media, 1) if media is not None else None,
+                                    "cubos": dict(zip(map(str, self.limites), datos["cubos"]))}
+        return resultado
+
+class RegistroMetricas:
+    """
+    Registro de métricas del proceso. Se exporta en formato de texto de Prometheus por un
+    servidor HTTP local opcional (/metrics y /salud) y como JSON al cerrar la aplicación.
+    """
+    def __init__(self):
+        self.inicio = time.time()
+        self._metricas = {}
+        self._bloqueo = threading.Lock()  # Protege el diccionario de métricas
+        self._bloqueo_valores = threading.Lock()  # Compartido por los valores de todas las métricas
+        self._servidor = None
+
+    def _obtener(self, clase, nombre, ayuda, **opciones):
+        with self._bloqueo:
+            metrica = self._metricas.get(nombre)
+            if metrica is None:
+                metrica = self._metricas[nombre] = clase(nombre, ayuda, self._bloqueo_valores, **opciones)
+            return metrica
+
+    def contador(self, nombre, ayuda=""):
+        return self._obtener(Contador, nombre, ayuda)
+
+    def indicador(self, nombre, ayuda="", funcion=None):
+        indicador = self._obtener(Indicador, nombre, ayuda)
+        if funcion is not None:
+            indicador.funcion = funcion
+        return indicador
+
+    def histograma(self, nombre, ayuda="", limites=LIMITES_LATENCIA_MS):
+        return self._obtener(Histograma, nombre, ayuda, limites=limites)
+
+    def registrar_error(self, origen, error):
+        """Cuenta un error por componente y tipo de excepción."""
+        tipo = error if isinstance(error, str) else type(error).__name__
+        self.contador("tarca_errores_total", "Errores por componente y tipo").inc(origen=origen, tipo=tipo)
+
+    @contextmanager
+    def medir_llamada(self, ruta):
+        """Cuenta la llamada al modelo como en curso y registra su latencia al terminar."""
+        en_curso = self.indicador("tarca_modelo_llamadas_en_curso", "Llamadas al modelo en curso")
+        en_curso.inc()
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            latencia_ms = (time.perf_counter() - inicio) * 1000
+            en_curso.dec()
+            self.indicador("tarca_modelo_ultima_latencia_ms", "Latencia de la última llamada al modelo").fijar(
+                round(latencia_ms, 1), ruta=ruta)
+            self.histograma("tarca_modelo_latencia_ms", "Latencia de las llamadas al modelo").observar(latencia_ms, ruta=ruta)
+
+    def _todas(self):
+        with self._bloqueo:
+            return sorted(self._metricas.values(), key=lambda metrica: metrica.nombre)
+
+    def texto_prometheus(self):
+        lineas = []
+        for metrica in self._todas():
+            lineas.extend(metrica.lineas_prometheus())
+        lineas.append("# HELP tarca_segundos_activo Segundos desde el arranque")
+        lineas.append("# TYPE tarca_segundos_activo gauge")
+        lineas.append(f"tarca_segundos_activo {round(time.time() - self.inicio, 1)}")
+        return "\n".join(lineas) + "\n"
+
+    def instantanea(self):
+        return {
+            "instante": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "segundos_activo": round(time.time() - self.inicio, 1),
+            "metricas": {metrica.nombre: metrica.instantanea() for metrica in self._todas()},
+        }
+
+    def escribir_instantanea(self, ruta=RUTA_INSTANTANEA):
+        """Guarda la instantánea en JSON (archivo temporal + reemplazo)."""
+        ruta_temporal = f"{ruta}.tmp"
+        try:
+            with open(ruta_temporal, "w", encoding="utf-8") as f:
+                json.dump(self.instantanea(), f, indent=2, ensure_ascii=False)
+            os.replace(ruta_temporal, ruta)
+            print(f"Métricas guardadas en '{ruta}'.")
+        except Exception as e:
+            print(f"Error al guardar las métricas en '{ruta}': {e}")
+
+    def iniciar_servidor(self, puerto, host=HOST_METRICAS):
+        """Sirve /metrics (Prometheus) y /salud (JSON) en un hilo en segundo plano."""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        registro = self
+
+        class ManejadorMetricas(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.startswith("/metrics"):
+                    cuerpo = registro.texto_prometheus().encode("utf-8")
+                    tipo = "text/plain; version=0.0.4; charset=utf-8"
+                elif self.path.startswith("/salud"):
+                    cuerpo = json.dumps({
+                        "estado": "ok",
+                        "segundos_activo": round(time.time() - registro.inicio, 1),
+                    }).encode("utf-8")
+                    tipo = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", tipo)
+                self.send_header("Content-Length", str(len(cuerpo)))
+                self.end_headers()
+                self.wfile.write(cuerpo)
+
+        try:
+            self._servidor = ThreadingHTTPServer((host, puerto), ManejadorMetricas)
+        except OSError as e:
+            print(f"No se pudo abrir el puerto de métricas {host}:{puerto}: {e}")
+            return None
+        self._servidor.daemon_threads = True
+        threading.Thread(target=self._servidor.serve_forever, name="metricas", daemon=True).start()
+        print(f"Métricas disponibles en http://{host}:{self._servidor.server_address[1]}/metrics")
+        return self._servidor
+
+    def detener_servidor(self):
+        if self._servidor:
+            self._servidor.shutdown()
+            self._servidor.server_close()
+            self._servidor = None
+
+registro_metricas = RegistroMetricas()
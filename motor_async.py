@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import concurrent.futures
+import threading
+from google.genai import types
+from cliente_genai import registrar_uso, sumar_tokens_al_hilo, uso_de_respuesta
+from prompts import PROMPT_PARA_GEMINI, PROMPT_PARA_GOOGLE_SEARCH, es_respuesta_valida
+from streaming import consultar_en_streaming_async
+
+class MotorAsync:
+    """
+    Motor asyncio que lanza a la vez la consulta directa a Gemini y la consulta con
+    Google Search, se queda con la primera respuesta válida y cancela la otra.
+    El bucle de eventos corre en un hilo propio para poder usarse desde el pipeline; los
+    tokens y los tiempos de streaming se devuelven y se anotan en el hilo que llama.
+    """
+    def __init__(self, cliente, modelo, streaming=False):
+        self.cliente = cliente
+        self.modelo = modelo
+        self.streaming = streaming
+        self.config_busqueda = types.GenerateContentConfig(
+            tools=[types.Tool(google_search=types.GoogleSearch())]
+        )
+        self.loop = asyncio.new_event_loop()
+        self._hilo = threading.Thread(target=self.loop.run_forever, name="motor-async", daemon=True)
+        self._hilo.start()
+
+    def resolver(self, contenido, timeout=None):
+        """
+        Versión bloqueante de la carrera. Devuelve (respuesta, ruta_ganadora, metricas) o
+        (None, None, None); las métricas son los tiempos de streaming de la ruta ganadora.
+        Suma al hilo que llama los tokens de las consultas que terminaron. Si pasan 'timeout'
+        segundos sin respuesta, cancela las dos consultas.
+        """
+        futuro = asyncio.run_coroutine_threadsafe(self.carrera(contenido), self.loop)
+        try:
+            texto, ruta, metricas, uso = futuro.result(timeout)
+        except concurrent.futures.TimeoutError:
+            futuro.cancel()
+            print(f"La carrera de modelos no respondió en {timeout:.1f} s; se cancela.")
+            return None, None, None
+        except Exception as e:
+            futuro.cancel()
+            print(f"Error en la carrera de modelos: {e}")
+            return None, None, None
+        sumar_tokens_al_hilo(uso)
+        return texto, ruta, metricas
+
+    async def _consultar(self, prompt, contenido, config=None):
+        """Devuelve (texto, metricas, uso); las métricas solo existen en streaming."""
+        if self.streaming:
+            texto, metricas, uso = await consultar_en_streaming_async(
+                self.cliente, self.modelo, [prompt, contenido], config
+            )
+            return texto or "", metricas, uso
+        respuesta = await self.cliente.aio.models.generate_content(
+            model=self.modelo,
+            contents=[prompt, contenido],
+            config=config,
+        )
+        registrar_uso()
+        texto = (respuesta.text or "").strip() if respuesta.candidates else ""
+        return texto, None, uso_de_respuesta(respuesta)
+
+    async def carrera(self, contenido):
+        """
+        Compite entre la ruta directa y la de Google Search; gana la primera respuesta válida.
+        Devuelve (respuesta, ruta, metricas, uso), con el uso sumado de las consultas terminadas.
+        """
+        tareas = {
+            asyncio.create_task(self._consultar(PROMPT_PARA_GEMINI, contenido)): "gemini",
+            asyncio.create_task(self._consultar(PROMPT_PARA_GOOGLE_SEARCH, contenido, self.config_busqueda)): "google_search",
+        }
+        pendientes = set(tareas)
+        uso_total = {"entrada": 0, "salida": 0, "total": 0}
+        try:
+            while pendientes:
+                terminadas, pendientes = await asyncio.wait(pendientes, return_when=asyncio.FIRST_COMPLETED)
+                for tarea in terminadas:
+                    ruta = tareas[tarea]
+                    if tarea.exception():
+                        print(f"La ruta '{ruta}' falló: {tarea.exception()}")
+                        continue
+                    texto, metricas, uso = tarea.result()
+                    for clave in uso_total:
+                        uso_total[clave] += uso[clave]
+                    if es_respuesta_valida(texto):
+                        print(f"Carrera ganada por '{ruta}': {texto}")
+                        return texto, ruta, metricas, uso_total
+                    print(f"La ruta '{ruta}' devolvió una respuesta no válida: {texto!r}")
+            return None, None, None, uso_total
+        finally:
+            for tarea in pendientes:
+                tarea.cancel()
+
+    def cerrar(self):
+        """Detiene el bucle de eventos."""
+        self.loop.call_soon_threadsafe(self.loop.stop)
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import re
+import time
+import unicodedata
+from config import leer_float, leer_int, leer_str
+
+# --- Configuración ---
+BACKEND_POR_DEFECTO = "tesseract"
+IDIOMAS_POR_DEFECTO = "spa"
+CONFIANZA_MINIMA = 70.0  # Confianza media (0-100) por debajo de la cual se envía la imagen
+MIN_CARACTERES = 15  # Menos texto que esto no se considera una pregunta
+MIN_OPCIONES = 2
+MAX_OPCIONES = 8  # Las respuestas válidas van de la A a la H
+# Marcas habituales delante de una opción: "A)", "b.", "3-", "•", "○"...
+PATRON_MARCA_OPCION = re.compile(r"^\s*(?:(?P<marca>[A-Ha-h]|\d{1,2})\s*[\)\.\-:]\s+|(?P<vineta>[•○●◯□■▪◦\-\*])\s*)")
+
+class ResultadoOCR:
+    """
+    Texto reconocido en una captura, ya separado en pregunta y opciones. Cada opción es un
+    par (letra, texto) con la letra que muestra la pantalla.
+    """
+    def __init__(self, pregunta, opciones, confianza, milisegundos):
+        self.pregunta = pregunta
+        self.opciones = opciones
+        self.confianza = confianza  # Media de la confianza por palabra (0-100)
+        self.milisegundos = milisegundos
+
+    @property
+    def texto(self):
+        """Pregunta y opciones con sus letras, en el orden de la pantalla."""
+        lineas = [self.pregunta]
+        lineas += [f"{letra}) {opcion}" for letra, opcion in self.opciones]
+        return "\n".join(lineas)
+
+    @property
+    def clave(self):
+        """
+        Clave de 64 bits del texto normalizado. Dos capturas con la misma pregunta y las mismas
+        opciones (en el mismo orden) comparten clave aunque sus píxeles difieran.
+        """
+        partes = [self.pregunta] + [f"{letra} {opcion}" for letra, opcion in self.opciones]
+        normalizado = "|".join(normalizar_texto(parte) for parte in partes)
+        return int.from_bytes(hashlib.blake2b(normalizado.encode("utf-8"), digest_size=8).digest(), "big")
+
+    def __str__(self):
+        return (f"{len(self.opciones)} opciones, confianza {self.confianza:.0f}, "
+                f"{len(self.texto)} caracteres en {self.milisegundos:.0f} ms")
+
+def normalizar_texto(texto):
+    """Minúsculas, sin tildes, sin signos de puntuación y con los espacios colapsados."""
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^\w]+", " ", texto).split())
+
+def _leer_marca(linea):
+    """
+    Marca de opción al principio de la línea como (tipo, posición) o None. El tipo separa
+    minúsculas, mayúsculas, números y viñetas; la posición es el orden esperado (0 para a/A/1).
+    Una línea acabada en '?' es una pregunta aunque empiece por una marca ("1. ¿Cuál...?").
+    """
+    coincidencia = PATRON_MARCA_OPCION.match(linea)
+    if coincidencia is None or linea.endswith("?"):
+        return None
+    marca = coincidencia.group("marca")
+    if marca is None:
+        return "vineta", None
+    if marca.isdigit():
+        return "numero", int(marca) - 1
+    return ("minuscula" if marca.islower() else "mayuscula"), ord(marca.lower()) - ord("a")
+
+def _secuencia_de_opciones(marcas, inicio):
+    """
+    Índices de las líneas que continúan la secuencia de marcas que empieza en 'inicio'
+    (a, b, c... / A, B, C... / 1, 2, 3... o la misma viñeta). Las líneas sin marca no la cortan.
+    """
+    tipo, _ = marcas[inicio]
+    indices = [inicio]
+    for i in range(inicio + 1, len(marcas)):
+        if marcas[i] is None:
+            continue
+        if marcas[i] != (tipo, None if tipo == "vineta" else len(indices)) or len(indices) == MAX_OPCIONES:
+            break
+        indices.append(i)
+    return indices
+
+def separar_pregunta_y_opciones(lineas):
+    """
+    Separa las líneas reconocidas en (pregunta, opciones), con cada opción como (letra, texto).
+    Una línea sin marca entre dos opciones continúa la anterior; tras la última opción solo
+    la continúa si el motor indica que es del mismo párrafo.
+    Si hay al menos MIN_OPCIONES líneas con marcas seguidas y del mismo tipo (a, b, c... /
+    A, B, C... / 1, 2, 3... / viñetas) se usan las marcas, conservando las letras de la pantalla;
+    si no, la pregunta termina en la primera línea acabada en '?' o ':' y cada línea siguiente
+    es una opción.
+    """
+    # Los motores pueden devolver (texto, párrafo) para que se sepa qué líneas van juntas
+    lineas = [linea if isinstance(linea, tuple) else (linea, None) for linea in lineas]
+    parrafos = [parrafo for linea, parrafo in lineas if linea.strip()]
+    lineas = [" ".join(linea.split()) for linea, _ in lineas if linea.strip()]
+    marcas = [_leer_marca(linea) for linea in lineas]
+    for inicio, marca in enumerate(marcas):
+        if marca is None or marca[1] not in (0, None):
+            continue
+        indices = _secuencia_de_opciones(marcas, inicio)
+        if len(indices) < MIN_OPCIONES:
+            continue
+        opciones = []
+        for i in range(inicio, len(lineas)):
+            if i in indices:
+                letra = chr(ord("A") + len(opciones))
+                if marcas[i][0] in ("minuscula", "mayuscula"):
+                    letra = PATRON_MARCA_OPCION.match(lineas[i]).group("marca").upper()
+                opciones.append((letra, PATRON_MARCA_OPCION.sub("", lineas[i], count=1)))
+            elif i < indices[-1] or (parrafos[i] is not None and parrafos[i] == parrafos[indices[-1]]):
+                opciones[-1] = (opciones[-1][0], f"{opciones[-1][1]} {lineas[i]}")  # Opción partida en varias líneas
+            else:
+                break  # Tras la última opción: pie, botones, reloj... no forman parte de ella
+        return " ".join(lineas[:inicio]), opciones
+
+    for i, linea in enumerate(lineas):
+        if linea.endswith(("?", ":")):
+            return " ".join(lineas[:i + 1]), [(chr(ord("A") + j), opcion) for j, opcion in enumerate(lineas[i + 1:])]
+    return " ".join(lineas), []
+
+class MotorTesseract:
+    """Reconocimiento con Tesseract a través de pytesseract (dependencia opcional)."""
+    def __init__(self, idiomas=IDIOMAS_POR_DEFECTO):
+        import pytesseract  # Solo se importa si se activa el OCR
+        self.pytesseract = pytesseract
+        self.idiomas = idiomas
+
+    def reconocer(self, imagen):
+        """Devuelve (lineas, confianza_media) de la imagen; cada línea es (texto, párrafo)."""
+        datos = self.pytesseract.image_to_data(
+            imagen.convert("L"), lang=self.idiomas, output_type=self.pytesseract.Output.DICT
+        )
+        lineas, confianzas = {}, []
+        for i, palabra in enumerate(datos["text"]):
+            confianza = float(datos["conf"][i])
+            if not palabra.strip() or confianza < 0:
+                continue
+            confianzas.append(confianza)
+            clave_linea = (datos["block_num"][i], datos["par_num"][i], datos["line_num"][i])
+            lineas.setdefault(clave_linea, []).append(palabra)
+        confianza_media = sum(confianzas) / len(confianzas) if confianzas else 0.0
+        lineas = [(" ".join(palabras), clave_linea[:2]) for clave_linea, palabras in lineas.items()]
+        return lineas, confianza_media
+
+# Motores disponibles; se pueden añadir otros con registrar_backend_ocr
+BACKENDS_OCR = {"tesseract": MotorTesseract}
+
+def registrar_backend_ocr(nombre, clase):
+    """
+    Registra un motor de OCR: una clase con __init__(idiomas) y reconocer(imagen) -> (lineas, confianza).
+    Cada línea es un texto o un par (texto, párrafo) con cualquier identificador de párrafo.
+    """
+    BACKENDS_OCR[nombre.lower()] = clase
+
+class LectorOCR:
+    """Pasada de OCR previa al modelo: decide si la captura puede enviarse como texto."""
+    def __init__(self, motor, confianza_minima=CONFIANZA_MINIMA, min_caracteres=MIN_CARACTERES):
+        self.motor = motor
+        self.confianza_minima = confianza_minima
+        self.min_caracteres = min_caracteres
+
+    @classmethod
+    def desde_entorno(cls):
+        """Crea el lector con OCR_BACKEND/OCR_IDIOMAS, o devuelve None si el motor no está disponible."""
+        nombre = leer_str("OCR_BACKEND", BACKEND_POR_DEFECTO).lower()
+        clase = BACKENDS_OCR.get(nombre)
+        if clase is None:
+            print(f"Motor de OCR desconocido: '{nombre}'. Se envía siempre la imagen.")
+            return None
+        try:
+            motor = clase(leer_str("OCR_IDIOMAS", IDIOMAS_POR_DEFECTO))
+        except Exception as e:
+            print(f"No se pudo iniciar el motor de OCR '{nombre}' ({e}). Se envía siempre la imagen.")
+            return None
+        return cls(
+            motor,
+            confianza_minima=leer_float("OCR_CONFIANZA_MINIMA", CONFIANZA_MINIMA),
+            min_caracteres=leer_int("OCR_MIN_CARACTERES", MIN_CARACTERES),
+        )
+
+    def leer(self, imagen):
+        """
+        Devuelve un ResultadoOCR si el texto es fiable (confianza suficiente y una pregunta con
+        entre MIN_OPCIONES y MAX_OPCIONES opciones) o None para recurrir a la imagen.
+        """
+        inicio = time.perf_counter()
+        lineas, confianza = self.motor.reconocer(imagen)
+        pregunta, opciones = separar_pregunta_y_opciones(lineas)
+        resultado = ResultadoOCR(pregunta, opciones, confianza, (time.perf_counter() - inicio) * 1000)
+        if confianza < self.confianza_minima:
+            print(f"OCR poco fiable ({resultado}); se envía la imagen.")
+            return None
+        if len(resultado.texto) < self.min_caracteres or not MIN_OPCIONES <= len(opciones) <= MAX_OPCIONES:
+            print(f"OCR sin pregunta reconocible ({resultado}); se envía la imagen.")
+            return None
+        return resultado
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from trazas import registro_trazas
+from metricas import registro_metricas
+
+# --- Configuración ---
+HILOS_INFERENCIA = 2
+TAMANO_COLA = 4
+
+def _poner_descartando_antiguo(cola, elemento):
+    """Añade un elemento a una cola acotada; si está llena descarta el más antiguo."""
+    while True:
+        try:
+            cola.put_nowait(elemento)
+            return
+        except queue.Full:
+            try:
+                cola.get_nowait()
+            except queue.Empty:
+                pass
+
+class PipelineCapturas:
+    """
+    Procesa las capturas por etapas: detección -> carga -> inferencia -> visualización.
+    Cada etapa tiene su propia cola acotada y la inferencia se reparte en un pool de hilos.
+    Solo se muestra la respuesta de la captura más reciente ("la última gana").
+    """
+    def __init__(self, manejador, hilos_inferencia=HILOS_INFERENCIA, tamano_cola=TAMANO_COLA):
+        self.manejador = manejador
+        self.hilos_inferencia = max(1, hilos_inferencia)
+        self._cola_carga = queue.Queue(maxsize=tamano_cola)
+        self._cola_visualizacion = queue.Queue(maxsize=tamano_cola)
+        self._ejecutor = ThreadPoolExecutor(max_workers=self.hilos_inferencia, thread_name_prefix="inferencia")
+        self._huecos_inferencia = threading.BoundedSemaphore(self.hilos_inferencia)  # Contrapresión
+        self._bloqueo = threading.Lock()
+        self._ultimo_id = 0
+        self._en_inferencia = 0
+        self._hilos = []
+        registro_metricas.indicador("tarca_pipeline_cola_carga", "Capturas esperando la etapa de carga",
+                                    funcion=self._cola_carga.qsize)
+        registro_metricas.indicador("tarca_pipeline_en_inferencia", "Capturas en el pool de inferencia",
+                                    funcion=lambda: self._en_inferencia)
+        self._descartadas = registro_metricas.contador("tarca_pipeline_descartadas_total",
+                                                       "Capturas descartadas por haber otra más reciente")
+
+    def iniciar(self):
+        """Arranca los hilos de las etapas de carga y visualización."""
+        for destino, nombre in ((self._etapa_carga, "carga"), (self._etapa_visualizacion, "visualizacion")):
+            hilo = threading.Thread(target=destino, name=f"pipeline-{nombre}", daemon=True)
+            hilo.start()
+            self._hilos.append(hilo)
+
+    def detener(self):
+        """Detiene las etapas y descarta las inferencias que aún no han empezado."""
+        _poner_descartando_antiguo(self._cola_carga, None)
+        _poner_descartando_antiguo(self._cola_visualizacion, None)
+        self._ejecutor.shutdown(wait=False, cancel_futures=True)
+
+    def enviar(self, origen, traza=None):
+        """Etapa de detección: registra una nueva captura (ruta o captura en memoria)."""
+        with self._bloqueo:
+            self._ultimo_id += 1
+            id_captura = self._ultimo_id
+        traza = traza or getattr(origen, "traza", None) or registro_trazas.nueva_traza(f"pipeline_{id_captura}")
+        from ticker_display import show_processing_state  # La bandeja solo se carga si hay escritorio
+        show_processing_state()
+        _poner_descartando_antiguo(self._cola_carga, (id_captura, origen, traza))
+        return id_captura
+
+    def en_curso(self):
+        """Número aproximado de capturas pendientes o en inferencia."""
+        return self._cola_carga.qsize() + self._en_inferencia
+
+    def _es_vigente(self, id_captura):
+        return id_captura == self._ultimo_id
+
+    def _etapa_carga(self):
+        """Carga y preprocesa la imagen, y la entrega al pool de inferencia cuando hay hueco."""
+        while True:
+            elemento = self._cola_carga.get()
+            if elemento is None:
+                break
+            id_captura, origen, traza = elemento
+            traza.marcar_desde_ultimo("espera_carga")
+            if not self._es_vigente(id_captura):
+                print(f"Captura #{id_captura} descartada: hay una captura más reciente.")
+                traza.finalizar(descartada=True)
+                self._descartadas.inc(etapa="carga")
+                continue
+
+            with traza.span("carga"):
+                imagen = self.manejador.cargar_imagen(origen)
+            if imagen is None:
+                _poner_descartando_antiguo(self._cola_visualizacion, (id_captura, None, traza))
+                continue
+            with traza.span("preprocesado"):
+                imagen, contenido = self.manejador.preparar_imagen(imagen, origen)
+
+            # Si todos los hilos de inferencia están ocupados, esta etapa espera (contrapresión)
+            self._huecos_inferencia.acquire()
+            if not self._es_vigente(id_captura):
+                self._huecos_inferencia.release()
+                print(f"Captura #{id_captura} descartada antes de la inferencia: hay una más reciente.")
+                traza.finalizar(descartada=True)
+                self._descartadas.inc(etapa="inferencia")
+                continue
+            with self._bloqueo:
+                self._en_inferencia += 1
+            try:
+                self._ejecutor.submit(self._etapa_inferencia, id_captura, origen, imagen, contenido, traza)
+            except RuntimeError:
+                self._liberar_hueco()  # El pool ya se ha cerrado
+                break
+
+    def _etapa_inferencia(self, id_captura, origen, imagen, contenido, traza):
+        """Consulta la caché o el modelo en uno de los hilos del pool."""
+        traza.marcar_desde_ultimo("espera_inferencia")
+        try:
+            with traza.span("inferencia"):
+                respuesta = self.manejador.obtener_respuesta(
+                    imagen, self.manejador.nombre_origen(origen), self.manejador.ruta_origen(origen), contenido
+                )
+            _poner_descartando_antiguo(self._cola_visualizacion, (id_captura, respuesta, traza))
+        except Exception as e:
+            print(f"Error inesperado en la inferencia de la captura #{id_captura}: {e}")
+            registro_metricas.registrar_error("pipeline", e)
+            _poner_descartando_antiguo(self._cola_visualizacion, (id_captura, None, traza))
+        finally:
+            self._liberar_hueco()
+
+    def _liberar_hueco(self):
+        with self._bloqueo:
+            self._en_inferencia -= 1
+        self._huecos_inferencia.release()
+
+    def _etapa_visualizacion(self):
+        """Actualiza la bandeja solo con el resultado de la captura más reciente."""
+        from ticker_display import update_ticker, reset_to_default_state
+
+        while True:
+            elemento = self._cola_visualizacion.get()
+            if elemento is None:
+                break
+            id_captura, respuesta, traza = elemento
+            traza.marcar_desde_ultimo("espera_visualizacion")
+            if not self._es_vigente(id_captura):
+                print(f"Respuesta de la captura #{id_captura} descartada: ya hay una captura más reciente.")
+                traza.finalizar(descartada=True)
+                self._descartadas.inc(etapa="visualizacion")
+                continue
+            with traza.span("visualizacion"):
+                if respuesta:
+                    update_ticker(respuesta)
+                else:
+                    reset_to_default_state()
+            traza.finalizar(respuesta=respuesta)
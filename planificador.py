@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+import random
+import threading
+import time
+from metricas import registro_metricas
+
+# --- Configuración ---
+NIVELES_POR_DEFECTO = "busqueda:gemini-2.5-flash,gemini-2.5-flash,gemini-2.5-flash-lite"
+CODIGOS_TRANSITORIOS = (408, 429, 500, 502, 503, 504)
+FACTOR_SUAVIZADO = 0.3  # Peso de la última latencia en la media móvil de cada nivel
+
+class RespuestaNoValida(Exception):
+    """El modelo respondió, pero no con el formato de letras esperado."""
+
+class LimitadorTokens:
+    """Cubo de tokens: permite ráfagas de 'capacidad' peticiones y recarga a ritmo constante."""
+    def __init__(self, peticiones_por_minuto, capacidad=None):
+        self.recarga_por_segundo = peticiones_por_minuto / 60
+        self.capacidad = capacidad or max(1, int(peticiones_por_minuto // 6))
+        self._tokens = float(self.capacidad)
+        self._ultimo = time.monotonic()
+        self._bloqueo = threading.Lock()
+
+    def _recargar(self, ahora):
+        self._tokens = min(self.capacidad, self._tokens + (ahora - self._ultimo) * self.recarga_por_segundo)
+        self._ultimo = ahora
+
+    def adquirir(self, limite=None):
+        """Espera a que haya un token. Devuelve False si no llega antes del instante 'limite' (monotonic)."""
+        while True:
+            with self._bloqueo:
+                ahora = time.monotonic()
+                self._recargar(ahora)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                espera = (1 - self._tokens) / self.recarga_por_segundo
+            if limite is not None and ahora + espera > limite:
+                return False
+            time.sleep(espera)
+
+class NivelModelo:
+    """Un nivel de la cadena de respaldo: un modelo, con o sin Google Search."""
+    def __init__(self, modelo, busqueda=False):
+        self.modelo = modelo
+        self.busqueda = busqueda
+        self.latencia_media_ms = None  # Media móvil de las respuestas correctas
+
+    def __str__(self):
+        return f"busqueda:{self.modelo}" if self.busqueda else self.modelo
+
+def leer_niveles(texto):
+    """Convierte 'busqueda:modelo-a,modelo-b' en una lista de NivelModelo."""
+    niveles = []
+    for parte in texto.split(","):
+        parte = parte.strip()
+        if not parte:
+            continue
+        if parte.startswith("busqueda:"):
+            niveles.append(NivelModelo(parte[len("busqueda:"):], busqueda=True))
+        else:
+            niveles.append(NivelModelo(parte))
+    return niveles
+
+def es_error_transitorio(error):
+    """Errores de cuota, de servidor o de red que merece la pena reintentar."""
+    codigo = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if isinstance(codigo, int):
+        return codigo in CODIGOS_TRANSITORIOS
+    try:
+        import httpx
+        return isinstance(error, httpx.TransportError)
+    except ImportError:
+        return isinstance(error, (ConnectionError, TimeoutError))
+
+def es_timeout(error):
+    """La petición superó su tiempo máximo."""
+    if isinstance(error, TimeoutError):
+        return True
+    try:
+        import httpx
+        return isinstance(error, httpx.TimeoutException)
+    except ImportError:
+        return False
+
+class PlanificadorModelos:
+    """
+    Ejecuta una consulta al modelo con límite de ritmo, reintentos con espera exponencial
+    aleatoria y un plazo total. Si un nivel falla o no cabe en el tiempo que queda, pasa
+    al siguiente nivel de la lista de respaldo.
+    """
+    def __init__(self, niveles, limitador=None, max_reintentos=2, espera_base_ms=250,
+                 espera_maxima_ms=2000, presupuesto_ms=10000, timeout_nivel_ms=0):
+        self.niveles = niveles
+        self.limitador = limitador
+        self.max_reintentos = max_reintentos
+        self.espera_base_ms = espera_base_ms
+        self.espera_maxima_ms = espera_maxima_ms
+        self.presupuesto_ms = presupuesto_ms
+        self.timeout_nivel_ms = timeout_nivel_ms  # Máximo por intento (0 = todo el tiempo restante)
+
+    def _espera_reintento(self, intento):
+        """Espera exponencial con jitter completo, en segundos."""
+        return random.uniform(0, min(self.espera_maxima_ms, self.espera_base_ms * 2 ** intento)) / 1000
+
+    def ejecutar(self, consultar):
+        """
+        Llama a consultar(nivel, timeout_ms) nivel a nivel hasta obtener una respuesta.
+        Devuelve (respuesta, nivel) o (None, None) si todos los niveles fallan o se agota el plazo.
+        """
+        limite = time.monotonic() + self.presupuesto_ms / 1000
+        for posicion, nivel in enumerate(self.niveles):
+            hay_siguiente = posicion < len(self.niveles) - 1
+            for intento in range(self.max_reintentos + 1):
+                restante_ms = (limite - time.monotonic()) * 1000
+                if restante_ms <= 0:
+                    print("Plazo de la consulta agotado.")
+                    return None, None
+                # Si este nivel suele tardar más de lo que queda, mejor pasar al siguiente
+                if hay_siguiente and nivel.latencia_media_ms and nivel.latencia_media_ms > restante_ms:
+                    print(f"'{nivel}' no cabe en los {restante_ms:.0f} ms restantes; se pasa al siguiente nivel.")
+                    break
+                if self.limitador and not self.limitador.adquirir(limite):
+                    print("Límite de peticiones alcanzado: no hay cupo antes del plazo.")
+                    return None, None
+
+                inicio = time.monotonic()
+                try:
+                    timeout_ms = int((limite - inicio) * 1000)
+                    if self.timeout_nivel_ms and hay_siguiente:
+                        timeout_ms = min(timeout_ms, self.timeout_nivel_ms)
+                    respuesta = consultar(nivel, timeout_ms)
+                    latencia_ms = (time.monotonic() - inicio) * 1000
+                    nivel.latencia_media_ms = latencia_ms if nivel.latencia_media_ms is None else (
+                        FACTOR_SUAVIZADO * latencia_ms + (1 - FACTOR_SUAVIZADO) * nivel.latencia_media_ms)
+                    if posicion:
+                        print(f"Respuesta obtenida con el nivel de respaldo '{nivel}'.")
+                        registro_metricas.contador("tarca_planificador_respaldos_total",
+                                                   "Respuestas obtenidas con un nivel de respaldo").inc(nivel=str(nivel))
+                    return respuesta, nivel
+                except RespuestaNoValida as e:
+                    print(f"'{nivel}' devolvió una respuesta no válida: {e}")
+                    registro_metricas.registrar_error("planificador", e)
+                    break
+                except Exception as e:
+                    registro_metricas.registrar_error("planificador", e)
+                    if es_timeout(e):
+                        print(f"'{nivel}' superó su tiempo máximo; se pasa al siguiente nivel.")
+                        break
+                    if not es_error_transitorio(e):
+                        print(f"Error no recuperable con '{nivel}': {e}")
+                        break
+                    if intento == self.max_reintentos:
+                        print(f"'{nivel}' sigue fallando tras {intento + 1} intentos: {e}")
+                        break
+                    espera = self._espera_reintento(intento)
+                    if time.monotonic() + espera >= limite:
+                        break
+                    print(f"Error transitorio con '{nivel}' ({e}); reintento en {espera * 1000:.0f} ms.")
+                    time.sleep(espera)
+        return None, None
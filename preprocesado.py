@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+import io
+import threading
+import time
+from collections import OrderedDict
+from PIL import Image, ImageChops
+from config import leer_bool, leer_int, leer_str
+from trazas import id_captura_desde_ruta
+
+# --- Configuración ---
+FORMATOS_MIME = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+MARGEN_RECORTE_AUTO = 8  # Píxeles que se conservan alrededor del contenido detectado
+MAX_CURSORES = 64  # Posiciones de cursor pendientes que se recuerdan como mucho
+
+def _leer_rectangulo(nombre, valores_esperados):
+    """Lee una lista de enteros separada por comas ('x,y,ancho,alto' o 'ancho,alto')."""
+    valor = leer_str(nombre)
+    if not valor:
+        return None
+    try:
+        numeros = tuple(int(parte) for parte in valor.split(","))
+    except ValueError:
+        numeros = ()
+    if len(numeros) != valores_esperados:
+        print(f"Valor no válido para {nombre}: '{valor}'. Se ignora.")
+        return None
+    return numeros
+
+class ConfigPreprocesado:
+    """Opciones del preprocesado que se aplica a la captura antes de enviarla al modelo."""
+    def __init__(self, max_dimension=0, escala_grises=False, formato="", calidad=85,
+                 recorte=None, recorte_cursor=None, recorte_auto=False):
+        self.max_dimension = max_dimension  # Lado mayor máximo en píxeles (0 = sin límite)
+        self.escala_grises = escala_grises
+        self.formato = formato.upper()  # "JPEG", "WEBP", "PNG" o "" para dejar que genai lo codifique
+        self.calidad = calidad
+        self.recorte = recorte  # (x, y, ancho, alto) relativo al monitor capturado
+        self.recorte_cursor = recorte_cursor  # (ancho, alto) centrado en el cursor
+        self.recorte_auto = recorte_auto  # Quita los márgenes de color uniforme
+
+    @classmethod
+    def desde_entorno(cls):
+        """Construye la configuración a partir de las variables de entorno PREPROC_*."""
+        formato = leer_str("PREPROC_FORMATO").upper()
+        if formato and formato not in FORMATOS_MIME:
+            print(f"Formato de preprocesado no soportado: '{formato}'. Se enviará la imagen sin recodificar.")
+            formato = ""
+        return cls(
+            max_dimension=leer_int("PREPROC_MAX_DIMENSION", 0),
+            escala_grises=leer_bool("PREPROC_GRISES"),
+            formato=formato,
+            calidad=leer_int("PREPROC_CALIDAD", 85),
+            recorte=_leer_rectangulo("PREPROC_RECORTE", 4),
+            recorte_cursor=_leer_rectangulo("PREPROC_RECORTE_CURSOR", 2),
+            recorte_auto=leer_bool("PREPROC_RECORTE_AUTO"),
+        )
+
+    @property
+    def activo(self):
+        return bool(self.max_dimension or self.escala_grises or self.formato or self.recorte
+                    or self.recorte_cursor or self.recorte_auto)
+
+class RegistroCursores:
+    """
+    Posición del cursor de las capturas que llegan por carpeta, por id de captura (como las
+    trazas), para que PREPROC_RECORTE_CURSOR funcione también sin CAPTURA_EN_MEMORIA.
+    """
+    def __init__(self, max_cursores=MAX_CURSORES):
+        self.max_cursores = max_cursores
+        self._cursores = OrderedDict()  # id_captura -> (x, y) relativo al monitor
+        self._bloqueo = threading.Lock()
+
+    def registrar(self, ruta, cursor):
+        with self._bloqueo:
+            self._cursores[id_captura_desde_ruta(ruta)] = cursor
+            while len(self._cursores) > self.max_cursores:
+                self._cursores.popitem(last=False)
+
+    def extraer(self, ruta):
+        """Devuelve y olvida la posición del cursor de la captura, o None si no se conoce."""
+        with self._bloqueo:
+            return self._cursores.pop(id_captura_desde_ruta(ruta), None)
+
+registro_cursores = RegistroCursores()
+
+class EstadisticasPreprocesado:
+    """
+    Resultado medido del preprocesado de una captura. 'pixeles_antes' y 'pixeles_despues' son
+    bytes de píxeles sin comprimir; 'bytes_envio' es el tamaño codificado que se sube al modelo,
+    o None si la imagen se envía sin recodificar (la codifica genai y no se mide aquí).
+    """
+    def __init__(self, tamano_original, tamano_final, pixeles_antes, pixeles_despues, bytes_envio,
+                 formato, milisegundos):
+        self.tamano_original = tamano_original
+        self.tamano_final = tamano_final
+        self.pixeles_antes = pixeles_antes
+        self.pixeles_despues = pixeles_despues
+        self.bytes_envio = bytes_envio
+        self.formato = formato
+        self.milisegundos = milisegundos
+
+    def __str__(self):
+        (ancho_o, alto_o), (ancho_f, alto_f) = self.tamano_original, self.tamano_final
+        envio = f"{self.bytes_envio / 1024:.0f} KB" if self.bytes_envio is not None else "sin medir"
+        return (f"{ancho_o}x{alto_o} -> {ancho_f}x{alto_f}, "
+                f"píxeles sin comprimir {self.pixeles_antes / 1024:.0f} KB -> {self.pixeles_despues / 1024:.0f} KB, "
+                f"envío {envio} ({self.formato}) en {self.milisegundos:.1f} ms")
+
+def _recorte_alrededor(cursor, ancho, alto, tamano_imagen):
+    """Rectángulo (izq, arriba, der, abajo) de ancho x alto centrado en el cursor y dentro de la imagen."""
+    ancho_img, alto_img = tamano_imagen
+    ancho, alto = min(ancho, ancho_img), min(alto, alto_img)
+    izquierda = min(max(cursor[0] - ancho // 2, 0), ancho_img - ancho)
+    arriba = min(max(cursor[1] - alto // 2, 0), alto_img - alto)
+    return (izquierda, arriba, izquierda + ancho, arriba + alto)
+
+def _caja_contenido(imagen):
+    """Caja que contiene todo lo que no es del color de fondo (tomado de la esquina superior izquierda)."""
+    fondo = Image.new(imagen.mode, imagen.size, imagen.getpixel((0, 0)))
+    caja = ImageChops.difference(imagen, fondo).getbbox()
+    if not caja:
+        return None
+    izquierda, arriba, derecha, abajo = caja
+    return (max(izquierda - MARGEN_RECORTE_AUTO, 0), max(arriba - MARGEN_RECORTE_AUTO, 0),
+            min(derecha + MARGEN_RECORTE_AUTO, imagen.width), min(abajo + MARGEN_RECORTE_AUTO, imagen.height))
+
+def preprocesar_imagen(imagen, config, cursor=None):
+    """
+    Aplica recorte, reducción, escala de grises y recodificación a la imagen.
+    Devuelve (imagen_procesada, contenido_para_el_modelo, estadisticas). El contenido es
+    un types.Part con los bytes codificados, o la propia imagen si no se fija un formato.
+    """
+    inicio = time.perf_counter()
+    tamano_original = imagen.size
+    pixeles_antes = imagen.width * imagen.height * len(imagen.getbands())  # Bytes sin comprimir
+
+    if config.recorte:
+        x, y, ancho, alto = config.recorte
+        imagen = imagen.crop((x, y, min(x + ancho, imagen.width), min(y + alto, imagen.height)))
+    elif config.recorte_cursor and cursor:
+        imagen = imagen.crop(_recorte_alrededor(cursor, *config.recorte_cursor, imagen.size))
+    elif config.recorte_cursor:
+        print("Posición del cursor desconocida para esta captura (p. ej. en modo lote); se envía sin recortar.")
+
+    if config.recorte_auto:
+        caja = _caja_contenido(imagen.convert("RGB"))
+        if caja:
+            imagen = imagen.crop(caja)
+
+    if config.escala_grises:
+        imagen = imagen.convert("L")
+
+    if config.max_dimension and max(imagen.size) > config.max_dimension:
+        imagen = imagen.copy()
+        imagen.thumbnail((config.max_dimension, config.max_dimension), Image.Resampling.LANCZOS)
+
+    contenido = imagen
+    pixeles_despues = imagen.width * imagen.height * len(imagen.getbands())
+    bytes_envio = None  # Sin formato no se codifica aquí: medirlo costaría una codificación extra
+    formato = "sin recodificar"
+    if config.formato:
+        buffer = io.BytesIO()
+        imagen_a_codificar = imagen.convert("RGB") if config.formato == "JPEG" and imagen.mode not in ("RGB", "L") else imagen
+        opciones = {"quality": config.calidad} if config.formato in ("JPEG", "WEBP") else {"optimize": False}
+        imagen_a_codificar.save(buffer, format=config.formato, **opciones)
+        datos = buffer.getvalue()
+        from google.genai import types
+        contenido = types.Part.from_bytes(data=datos, mime_type=FORMATOS_MIME[config.formato])
+        bytes_envio = len(datos)
+        formato = f"{config.formato} q{config.calidad}" if config.formato != "PNG" else "PNG"
+
+    milisegundos = (time.perf_counter() - inicio) * 1000
+    estadisticas = EstadisticasPreprocesado(tamano_original, imagen.size, pixeles_antes, pixeles_despues,
+                                            bytes_envio, formato, milisegundos)
+    return imagen, contenido, estadisticas
@@ -1,4 +1,12 @@
 # -*- coding: utf-8 -*-
+import re
+
+# Formato esperado de la respuesta: solo letras de opción (p. ej. "B" o "AC")
+PATRON_RESPUESTA = re.compile(r"^[A-H]+$")
+
+def es_respuesta_valida(texto):
+    """Comprueba que la respuesta del modelo tenga el formato pedido en los prompts."""
+    return bool(texto) and PATRON_RESPUESTA.match(texto.strip()) is not None
 
 # Prompt para Gemini
 PROMPT_PARA_GEMINI = """Analiza la pregunta y las opciones en la imagen.
@@ -7,6 +15,13 @@ Devuelve ÚNICAMENTE la letra de la opción u opciones correctas, comenzando des
 - Si hay varias respuestas correctas (p. ej., la primera y la tercera), devuelve las letras juntas: AC
 - No añadas texto, explicaciones, ni la palabra "respuesta". Solo las letras."""
 
+# Variante de solo texto: la pregunta y las opciones llegan ya reconocidas por OCR
+PROMPT_PARA_GEMINI_TEXTO = """Analiza la pregunta y las opciones del texto siguiente, extraído por OCR de una captura (puede contener pequeños errores de reconocimiento).
+Devuelve ÚNICAMENTE la letra de la opción u opciones correctas, tal y como aparece delante de cada opción en el texto.
+- Si solo hay una respuesta correcta (p. ej., la opción B), devuelve: B
+- Si hay varias respuestas correctas (p. ej., las opciones A y C), devuelve las letras juntas: AC
+- No añadas texto, explicaciones, ni la palabra "respuesta". Solo las letras."""
+
 # Prompt mejorado para Google Search
 PROMPT_PARA_GOOGLE_SEARCH = """Tu tarea es analizar la imagen que contiene una pregunta de opción múltiple.
 Basado en la pregunta y las opciones, y utilizando la información de búsqueda si es necesario, determina la(s) respuesta(s) correcta(s).
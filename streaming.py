@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import re
+import time
+from cliente_genai import registrar_uso, uso_de_respuesta
+
+# Letras de opción, juntas ("AC") o separadas por comas, espacios o "y" ("A, C", "A y C")
+_LETRAS = r"[A-H](?:(?:\s*,\s*|\s+y\s+|\s*)[A-H])*"
+# Solo un salto de línea o un punto cierran la secuencia antes del final del stream:
+# tras una coma, un espacio o una "y" aún puede llegar otra opción
+PATRON_RESPUESTA_COMPLETA = re.compile(rf"^\s*({_LETRAS})\s*[\.\n]")
+PATRON_RESPUESTA_FINAL = re.compile(rf"^\s*({_LETRAS})\s*\.?\s*$")
+
+def _unir_letras(texto):
+    """'A, C' -> 'AC': el mismo formato que piden los prompts."""
+    return "".join(re.findall(r"[A-H]", texto))
+
+class LectorRespuestaStreaming:
+    """
+    Acumula los fragmentos de una respuesta en streaming y detecta el momento en que
+    la secuencia de letras está completa. Registra el tiempo hasta el primer token
+    y hasta la respuesta.
+    """
+    def __init__(self):
+        self.texto = ""
+        self.respuesta = None
+        self.inicio = time.perf_counter()
+        self.instante_primer_token = None
+        self.instante_respuesta = None
+
+    def agregar(self, fragmento):
+        """Añade un fragmento. Devuelve la respuesta en cuanto está completa, o None."""
+        if self.instante_primer_token is None:
+            self.instante_primer_token = time.perf_counter()
+        self.texto += fragmento or ""
+        if self.respuesta is None:
+            coincidencia = PATRON_RESPUESTA_COMPLETA.match(self.texto)
+            if coincidencia:
+                self._fijar_respuesta(_unir_letras(coincidencia.group(1)))
+        return self.respuesta
+
+    def finalizar(self):
+        """Se llama al terminar el stream: valida el texto completo si aún no había respuesta."""
+        if self.respuesta is None:
+            coincidencia = PATRON_RESPUESTA_FINAL.match(self.texto)
+            if coincidencia:
+                self._fijar_respuesta(_unir_letras(coincidencia.group(1)))
+        return self.respuesta
+
+    def _fijar_respuesta(self, respuesta):
+        self.respuesta = respuesta
+        self.instante_respuesta = time.perf_counter()
+
+    def metricas(self):
+        """Tiempos en milisegundos hasta el primer token y hasta la respuesta (None si no hubo)."""
+        def _ms(instante):
+            return round((instante - self.inicio) * 1000, 1) if instante else None
+        return {"ttft_ms": _ms(self.instante_primer_token), "respuesta_ms": _ms(self.instante_respuesta)}
+
+def consultar_en_streaming(cliente, modelo, contenidos, config=None):
+    """
+    Consulta el modelo en streaming y cierra el stream en cuanto llega una respuesta válida.
+    Devuelve (respuesta, metricas); la respuesta es None si no se obtuvo una válida.
+    """
+    lector = LectorRespuestaStreaming()
+    fragmento = None
+    flujo = cliente.models.generate_content_stream(model=modelo, contents=contenidos, config=config)
+    try:
+        for fragmento in flujo:
+            if lector.agregar(fragmento.text):
+                break
+    finally:
+        flujo.close()  # Cierra la conexión sin esperar a los tokens restantes
+        registrar_uso(fragmento)  # El último fragmento recibido lleva el uso acumulado
+    return lector.finalizar(), lector.metricas()
+
+async def consultar_en_streaming_async(cliente, modelo, contenidos, config=None):
+    """
+    Versión asyncio de consultar_en_streaming, sobre cliente.aio. Devuelve (respuesta, metricas, uso):
+    corre en el hilo del bucle de eventos, así que los tokens se devuelven en lugar de sumarse a este hilo.
+    """
+    lector = LectorRespuestaStreaming()
+    fragmento = None
+    flujo = await cliente.aio.models.generate_content_stream(model=modelo, contents=contenidos, config=config)
+    try:
+        async for fragmento in flujo:
+            if lector.agregar(fragmento.text):
+                break
+    finally:
+        await flujo.aclose()
+        registrar_uso()
+    return lector.finalizar(), lector.metricas(), uso_de_respuesta(fragmento)
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+import os
+import threading
+import time
+from almacen_capturas import AlmacenCapturas
+
+def _captura_antigua(carpeta, nombre, dias):
+    ruta = carpeta / nombre
+    ruta.write_bytes(b"\x89PNG" + b"0" * 1024)
+    instante = time.time() - dias * 24 * 60 * 60
+    os.utime(ruta, (instante, instante))
+    return ruta
+
+def test_por_defecto_no_se_borra_ninguna_captura(tmp_path):
+    antigua = _captura_antigua(tmp_path, "antigua.png", dias=30)
+    almacen = AlmacenCapturas(str(tmp_path), ruta_manifiesto=str(tmp_path / "manifiesto.sqlite3"))
+    assert almacen.iniciar_poda(threading.Event()) is None
+    almacen.podar()
+    almacen.cerrar()
+    assert antigua.exists()
+
+def test_con_presupuesto_de_dias_se_borran_las_antiguas(tmp_path):
+    antigua = _captura_antigua(tmp_path, "antigua.png", dias=30)
+    reciente = _captura_antigua(tmp_path, "reciente.png", dias=0)
+    almacen = AlmacenCapturas(str(tmp_path), ruta_manifiesto=str(tmp_path / "manifiesto.sqlite3"), max_dias=7)
+    almacen.podar()
+    almacen.cerrar()
+    assert not antigua.exists() and reciente.exists()
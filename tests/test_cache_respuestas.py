@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from PIL import Image, ImageDraw
+
+from cache_respuestas import CacheRespuestas, calcular_huella
+
+def _pantalla_de_pregunta(pregunta, opciones):
+    """Misma maquetación de test (cabecera, caja de pregunta, opciones) con distinto texto."""
+    imagen = Image.new("RGB", (1280, 720), "white")
+    dibujo = ImageDraw.Draw(imagen)
+    dibujo.rectangle((0, 0, 1280, 60), fill=(30, 60, 120))
+    dibujo.rectangle((80, 120, 1200, 220), outline="black")
+    dibujo.text((100, 160), pregunta, fill="black")
+    for i, opcion in enumerate(opciones):
+        dibujo.ellipse((100, 280 + i * 80, 120, 300 + i * 80), outline="black")
+        dibujo.text((140, 285 + i * 80), opcion, fill="black")
+    return imagen
+
+def test_preguntas_con_la_misma_maquetacion_no_comparten_entrada(tmp_path):
+    primera = _pantalla_de_pregunta("¿Capital de Francia?", ["Madrid", "Roma", "Lisboa", "París"])
+    segunda = _pantalla_de_pregunta("¿Capital de Italia?", ["Berlín", "Roma", "Viena", "Atenas"])
+    assert calcular_huella(primera) != calcular_huella(segunda)
+
+    cache = CacheRespuestas(ruta=str(tmp_path / "cache.json"))
+    cache.guardar(calcular_huella(primera), "D")
+    assert cache.buscar(calcular_huella(segunda)) is None
+    assert cache.buscar(calcular_huella(primera.copy())) == "D"
+
+def test_la_cache_persiste_entre_instancias(tmp_path):
+    ruta = str(tmp_path / "cache.json")
+    imagen = _pantalla_de_pregunta("¿2 + 2?", ["3", "4"])
+    CacheRespuestas(ruta=ruta).guardar(calcular_huella(imagen), "B")
+    assert CacheRespuestas(ruta=ruta).buscar(calcular_huella(imagen)) == "B"
+
+def test_sin_cache_el_hash_del_manifiesto_no_se_calcula_en_el_hilo_de_inferencia(tmp_path, monkeypatch):
+    import threading
+    import gemini_handler
+    from almacen_capturas import AlmacenCapturas
+
+    hilos_del_hash = []
+    def _huella(contenido):
+        hilos_del_hash.append(threading.current_thread().name)
+        return calcular_huella(contenido)
+
+    monkeypatch.setenv("CACHE_RESPUESTAS", "false")
+    monkeypatch.setattr(gemini_handler, "calcular_huella", _huella)
+    almacen = AlmacenCapturas(str(tmp_path), ruta_manifiesto=str(tmp_path / "manifiesto.sqlite3"))
+    manejador = gemini_handler.ManejadorCapturas(almacen=almacen)
+    monkeypatch.setattr(manejador, "_resolver_respuesta", lambda *args: "B")
+
+    imagen = _pantalla_de_pregunta("¿2 + 2?", ["3", "4"])
+    assert manejador.obtener_respuesta(imagen, "c.png", "c.png") == "B"
+    manejador._escritor_manifiesto.shutdown(wait=True)
+    fila = almacen._conexion.execute("SELECT hash, respuesta FROM capturas WHERE ruta = 'c.png'").fetchone()
+    manejador.cerrar()
+
+    assert fila == (f"{calcular_huella(imagen):016x}", "B")
+    assert hilos_del_hash and threading.current_thread().name not in hilos_del_hash
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import os
+import queue
+
+# Los listeners no se usan aquí; el backend nulo permite importar pynput sin escritorio
+os.environ.setdefault("PYNPUT_BACKEND", "dummy")
+
+import pytest
+from PIL import Image, ImageDraw
+
+import captura_logic
+
+MONITOR = {"left": 0, "top": 0, "width": 1920, "height": 1080}
+
+class CapturaFalsa:
+    """Imita el ScreenShot de mss (tamaño y buffer BGRA)."""
+    def __init__(self, imagen):
+        self.size = imagen.size
+        self.bgra = imagen.convert("RGBA").tobytes("raw", "BGRA")
+
+def _pantalla(pregunta, opciones, reloj="10:41"):
+    imagen = Image.new("RGB", (MONITOR["width"], MONITOR["height"]), "white")
+    dibujo = ImageDraw.Draw(imagen)
+    dibujo.text((200, 200), pregunta, fill="black")
+    for i, opcion in enumerate(opciones):
+        dibujo.text((220, 300 + i * 60), opcion, fill="black")
+    dibujo.rectangle((0, 1030, 1920, 1080), fill=(40, 40, 40))  # Barra de tareas
+    dibujo.text((1800, 1050), reloj, fill="white")
+    return imagen
+
+@pytest.fixture
+def capturar(monkeypatch, tmp_path):
+    """Devuelve una función que 'pulsa F2' con la pantalla indicada y la captura entregada (o None)."""
+    repeticiones = []
+    monkeypatch.setattr(captura_logic, "CAPTURE_FOLDER", str(tmp_path))
+    monkeypatch.setattr(captura_logic, "cola_capturas", queue.Queue(maxsize=4))
+    monkeypatch.setattr(captura_logic, "obtener_posicion_cursor", lambda: (960, 540))
+    monkeypatch.setattr(captura_logic, "obtener_monitor_con_cursor", lambda posicion=None: MONITOR)
+    captura_logic.configurar_captura(en_memoria=True, guardar_en_disco=False)
+    captura_logic.configurar_deteccion_cambios(True, al_sin_cambios=lambda: repeticiones.append(True) or True)
+
+    def _capturar(pantalla):
+        monkeypatch.setattr(captura_logic.servicio_captura, "capturar", lambda monitor: CapturaFalsa(pantalla))
+        captura_logic.realizar_captura_pantalla()
+        try:
+            return captura_logic.cola_capturas.get_nowait()
+        except queue.Empty:
+            return None
+
+    _capturar.repeticiones = repeticiones
+    yield _capturar
+    captura_logic.configurar_deteccion_cambios(False)
+    captura_logic.configurar_captura()
+
+def test_pantalla_sin_cambios_repite_la_respuesta(capturar):
+    pantalla = _pantalla("¿Capital de Francia?", ["A) Madrid", "B) París"])
+    assert capturar(pantalla) is not None
+    assert capturar(pantalla.copy()) is None
+    assert capturar.repeticiones == [True]
+
+def test_si_solo_cambia_el_reloj_se_envia_la_captura_entera(capturar):
+    capturar(_pantalla("¿Capital de Francia?", ["A) Madrid", "B) París"], reloj="10:41"))
+    captura = capturar(_pantalla("¿Capital de Francia?", ["A) Madrid", "B) París"], reloj="10:42"))
+    assert captura is not None
+    assert captura.a_imagen_pil().size == (MONITOR["width"], MONITOR["height"])
+
+def test_si_cambia_la_pregunta_se_envian_tambien_las_opciones(capturar):
+    capturar(_pantalla("¿Capital de Francia?", ["A) Madrid", "B) Roma"]))
+    nueva = _pantalla("¿Capital de Italia?", ["A) Madrid", "B) Roma"])
+    captura = capturar(nueva)
+    assert captura is not None
+    assert captura.a_imagen_pil().tobytes() == nueva.tobytes()
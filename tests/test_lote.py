@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import csv
+import gemini_handler
+import lote
+from PIL import Image
+
+class ManejadorFalso:
+    """Responde 'A' salvo a las capturas de 'fallan', que se quedan sin respuesta."""
+    fallan = set()
+
+    def __init__(self, *args, **kwargs):
+        self.limitador = None
+
+    def cargar_imagen(self, ruta):
+        return Image.open(ruta)
+
+    def preparar_imagen(self, imagen, ruta):
+        return imagen, None
+
+    def obtener_respuesta(self, imagen, nombre, ruta, contenido):
+        return None if nombre in self.fallan else "A"
+
+    def cerrar(self):
+        pass
+
+def _leer_filas(ruta):
+    with open(ruta, encoding="utf-8", newline="") as f:
+        return list(csv.DictReader(f))
+
+def test_reanudar_deja_una_fila_por_captura(tmp_path, monkeypatch):
+    monkeypatch.setattr(gemini_handler, "ManejadorCapturas", ManejadorFalso)
+    carpeta = tmp_path / "capturas"
+    carpeta.mkdir()
+    for nombre in ("a.png", "b.png", "c.png"):
+        Image.new("RGB", (8, 8), "white").save(carpeta / nombre)
+    salida = str(tmp_path / "informe.csv")
+
+    ManejadorFalso.fallan = {"b.png"}
+    lote.ejecutar_lote(str(carpeta), salida, concurrencia=2)
+    ManejadorFalso.fallan = set()
+    resumen = lote.ejecutar_lote(str(carpeta), salida, concurrencia=2)
+
+    assert resumen["total"] == 1
+    filas = _leer_filas(salida)
+    assert sorted(fila["archivo"] for fila in filas) == ["a.png", "b.png", "c.png"]
+    assert all(fila["respuesta"] == "A" and not fila["error"] for fila in filas)
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from types import SimpleNamespace
+
+from cliente_genai import reiniciar_tokens_del_hilo, tokens_del_hilo
+from motor_async import MotorAsync
+
+class ModelosFalsos:
+    async def generate_content(self, model, contents, config=None):
+        uso = SimpleNamespace(prompt_token_count=100, candidates_token_count=1, total_token_count=101)
+        return SimpleNamespace(text="B", candidates=[object()], usage_metadata=uso)
+
+def test_los_tokens_de_la_carrera_se_anotan_en_el_hilo_que_llama():
+    cliente = SimpleNamespace(aio=SimpleNamespace(models=ModelosFalsos()))
+    motor = MotorAsync(cliente, "modelo")
+    try:
+        reiniciar_tokens_del_hilo()
+        respuesta, ruta, metricas = motor.resolver("contenido", timeout=5)
+    finally:
+        motor.cerrar()
+    assert respuesta == "B" and ruta in ("gemini", "google_search") and metricas is None
+    assert tokens_del_hilo()["total"] in (101, 202)  # La otra ruta puede haber terminado a la vez
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+from ocr import ResultadoOCR, separar_pregunta_y_opciones
+
+def test_pregunta_numerada_no_cuenta_como_opcion():
+    pregunta, opciones = separar_pregunta_y_opciones([
+        "1. ¿Cuál es la capital de Francia?",
+        "a) Madrid",
+        "b) París",
+        "c) Roma",
+    ])
+    assert pregunta == "1. ¿Cuál es la capital de Francia?"
+    assert opciones == [("A", "Madrid"), ("B", "París"), ("C", "Roma")]
+
+def test_marcas_sueltas_sin_secuencia_no_son_opciones():
+    pregunta, opciones = separar_pregunta_y_opciones([
+        "Según el apartado 3. del reglamento, señala la correcta:",
+        "b) Primera",
+        "d) Segunda",
+    ])
+    assert [letra for letra, _ in opciones] == ["A", "B"]
+    assert opciones[0][1] == "b) Primera"
+
+def test_se_conservan_las_letras_de_la_pantalla():
+    pregunta, opciones = separar_pregunta_y_opciones([
+        "¿Qué opción es correcta?",
+        "A) Uno",
+        "B) Dos partida",
+        "en dos líneas",
+        "C) Tres",
+    ])
+    assert opciones == [("A", "Uno"), ("B", "Dos partida en dos líneas"), ("C", "Tres")]
+    resultado = ResultadoOCR(pregunta, opciones, 90.0, 1.0)
+    assert resultado.texto.splitlines()[2] == "B) Dos partida en dos líneas"
+
+def test_opciones_numeradas_se_etiquetan_con_letras():
+    _, opciones = separar_pregunta_y_opciones(["¿Cuánto es 2 + 2?", "1. Tres", "2. Cuatro"])
+    assert opciones == [("A", "Tres"), ("B", "Cuatro")]
+
+def test_pie_y_reloj_tras_la_ultima_opcion_no_forman_parte_de_ella():
+    lineas = ["¿Cuál es la capital de Italia?", "a) Madrid", "b) París", "c) Roma",
+              "Siguiente página", "10:41 18/10/2026"]
+    pregunta, opciones = separar_pregunta_y_opciones(lineas)
+    assert opciones == [("A", "Madrid"), ("B", "París"), ("C", "Roma")]
+    clave = ResultadoOCR(pregunta, opciones, 90.0, 1.0).clave
+    lineas[-1] = "10:42 18/10/2026"
+    assert ResultadoOCR(*separar_pregunta_y_opciones(lineas), 90.0, 1.0).clave == clave
+
+def test_ultima_opcion_partida_sigue_junta_si_es_del_mismo_parrafo():
+    _, opciones = separar_pregunta_y_opciones([
+        ("¿Qué opción es correcta?", (1, 1)),
+        ("A) Uno", (2, 1)),
+        ("B) Dos partida", (2, 2)),
+        ("en dos líneas", (2, 2)),
+        ("Siguiente página", (3, 1)),
+    ])
+    assert opciones == [("A", "Uno"), ("B", "Dos partida en dos líneas")]
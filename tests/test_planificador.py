@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import time
+
+import pytest
+
+from planificador import LimitadorTokens, NivelModelo, PlanificadorModelos, RespuestaNoValida
+
+class ErrorApi(Exception):
+    """Imita los errores de genai, que llevan el código HTTP en 'code'."""
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+class ConsultaFalsa:
+    """consultar(nivel, timeout_ms) que sigue un guion por modelo: excepciones o respuestas."""
+    def __init__(self, **guiones):
+        self.guiones = {modelo: list(pasos) for modelo, pasos in guiones.items()}
+        self.llamadas = []
+
+    def __call__(self, nivel, timeout_ms):
+        self.llamadas.append(nivel.modelo)
+        paso = self.guiones[nivel.modelo].pop(0)
+        if callable(paso):
+            paso = paso()
+        if isinstance(paso, Exception):
+            raise paso
+        return paso
+
+def _planificador(*modelos, **opciones):
+    opciones.setdefault("espera_base_ms", 1)
+    return PlanificadorModelos([NivelModelo(modelo) for modelo in modelos], **opciones)
+
+def test_error_transitorio_se_reintenta_en_el_mismo_nivel():
+    consultar = ConsultaFalsa(principal=[ErrorApi(503), "B"], respaldo=["C"])
+    respuesta, nivel = _planificador("principal", "respaldo").ejecutar(consultar)
+    assert (respuesta, nivel.modelo) == ("B", "principal")
+    assert consultar.llamadas == ["principal", "principal"]
+
+def test_error_no_recuperable_pasa_al_siguiente_nivel():
+    consultar = ConsultaFalsa(principal=[ErrorApi(400)], respaldo=["C"])
+    respuesta, nivel = _planificador("principal", "respaldo").ejecutar(consultar)
+    assert (respuesta, nivel.modelo) == ("C", "respaldo")
+    assert consultar.llamadas == ["principal", "respaldo"]
+
+def test_respuesta_no_valida_pasa_al_siguiente_nivel():
+    consultar = ConsultaFalsa(principal=[RespuestaNoValida("La respuesta es B")], respaldo=["B"])
+    respuesta, nivel = _planificador("principal", "respaldo").ejecutar(consultar)
+    assert (respuesta, nivel.modelo) == ("B", "respaldo")
+    assert consultar.llamadas == ["principal", "respaldo"]
+
+def test_plazo_total_agotado():
+    def _lenta():
+        time.sleep(0.08)
+        return ErrorApi(400)
+    consultar = ConsultaFalsa(principal=[_lenta], respaldo=["C"])
+    assert _planificador("principal", "respaldo", presupuesto_ms=50).ejecutar(consultar) == (None, None)
+    assert consultar.llamadas == ["principal"]
+
+def test_nivel_lento_se_salta_si_no_cabe_en_el_tiempo_restante():
+    planificador = _planificador("principal", "respaldo", presupuesto_ms=1000)
+    planificador.niveles[0].latencia_media_ms = 5000
+    consultar = ConsultaFalsa(principal=["A"], respaldo=["C"])
+    respuesta, nivel = planificador.ejecutar(consultar)
+    assert (respuesta, nivel.modelo) == ("C", "respaldo")
+    assert consultar.llamadas == ["respaldo"]
+
+def test_limitador_espera_a_la_recarga():
+    limitador = LimitadorTokens(600, capacidad=1)  # Un token cada 0,1 s
+    inicio = time.monotonic()
+    assert limitador.adquirir()
+    assert limitador.adquirir()
+    assert time.monotonic() - inicio == pytest.approx(0.1, abs=0.05)
+
+def test_limitador_no_espera_mas_alla_del_limite():
+    limitador = LimitadorTokens(60, capacidad=1)  # Un token por segundo
+    assert limitador.adquirir()
+    inicio = time.monotonic()
+    assert not limitador.adquirir(limite=time.monotonic() + 0.1)
+    assert time.monotonic() - inicio < 0.05
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from PIL import Image
+
+import gemini_handler
+from preprocesado import ConfigPreprocesado, registro_cursores
+
+def test_recorte_por_cursor_en_modo_carpeta(monkeypatch):
+    monkeypatch.setenv("CACHE_RESPUESTAS", "false")
+    manejador = gemini_handler.ManejadorCapturas()
+    manejador.preprocesado = ConfigPreprocesado(recorte_cursor=(200, 100))
+    imagen = Image.new("RGB", (1920, 1080), "white")
+    ruta = "capturas/captura_20261018_104100_000000.png"
+
+    registro_cursores.registrar(ruta, (960, 540))
+    recortada, _ = manejador.preparar_imagen(imagen, ruta)
+    assert recortada.size == (200, 100)
+
+    # Sin posición conocida (p. ej. modo lote) se envía la captura entera
+    entera, _ = manejador.preparar_imagen(imagen, ruta)
+    assert entera.size == (1920, 1080)
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+import pytest
+from streaming import LectorRespuestaStreaming
+
+def _leer(fragmentos):
+    """Pasa los fragmentos al lector como el stream; devuelve (respuesta, fragmentos leídos)."""
+    lector = LectorRespuestaStreaming()
+    for leidos, fragmento in enumerate(fragmentos, start=1):
+        if lector.agregar(fragmento):
+            return lector.finalizar(), leidos
+    return lector.finalizar(), len(fragmentos)
+
+@pytest.mark.parametrize("fragmentos", [
+    ["A", ", ", "C"],
+    ["A", " y ", "C"],
+    ["A", " ", "C"],
+    ["A, C"],
+    ["AC"],
+])
+def test_varias_letras_no_cortan_la_respuesta(fragmentos):
+    assert _leer(fragmentos) == ("AC", len(fragmentos))
+
+def test_punto_o_salto_de_linea_cierran_la_respuesta_antes_de_tiempo():
+    assert _leer(["B", ".", " Porque..."]) == ("B", 2)
+    assert _leer(["A, C", "\n", "Explicación"]) == ("AC", 2)
+
+def test_texto_que_no_es_una_respuesta():
+    assert _leer(["La respuesta es B"]) == (None, 1)
@@ -1,7 +1,11 @@
 import threading
+from functools import lru_cache
+from itertools import combinations
 from pystray import Icon, MenuItem, Menu
 from PIL import Image, ImageDraw, ImageFont
 import sys
+import time
+from metricas import registro_metricas
 
 # Importar winsound para notificaciones de sonido solo en Windows
 try:
@@ -17,26 +21,44 @@ tray_icon = None
 shutdown_event_global = None
 last_known_answer = "" # Variable para guardar la última respuesta
 ninja_mode_enabled = False # Para controlar el estado del modo ninja
+stats_provider = None # Función que devuelve el texto de estadísticas para el menú (opcional)
+_font = None # Fuente cargada una sola vez
+_font_lock = threading.Lock()
+
+# --- Métricas de la bandeja ---
+_actualizaciones = registro_metricas.contador("tarca_bandeja_actualizaciones_total", "Cambios del ícono por estado")
+_ultima_respuesta = registro_metricas.indicador("tarca_bandeja_ultima_respuesta_timestamp",
+                                                "Instante (epoch) en que se mostró la última respuesta")
+registro_metricas.indicador("tarca_bandeja_iconos_en_cache", "Íconos generados en la caché",
+                            funcion=lambda: get_icon.cache_info().currsize)
+
+# --- Configuración de la caché de íconos ---
+ICON_CACHE_SIZE = 256
+ANSWER_LETTERS = "ABCDEFGH"
 
 # --- Funciones del ícono de la bandeja del sistema ---
 
+def get_font():
+    """Carga la fuente del ícono la primera vez y la reutiliza en adelante."""
+    global _font
+    with _font_lock:
+        if _font is None:
+            # Usar una fuente común de Windows. Si no se encuentra, usa la fuente por defecto.
+            try:
+                # Usar una fuente clara y de tamaño adecuado para la barra de tareas
+                _font = ImageFont.truetype("segoeui.ttf", size=18)
+            except IOError:
+                _font = ImageFont.load_default()
+        return _font
+
 def create_text_icon(text):
     """
     Crea dinámicamente una imagen de ícono que contiene el texto proporcionado.
     """
-    # Usar una fuente común de Windows. Si no se encuentra, usa la fuente por defecto.
-    try:
-        # Usar una fuente clara y de tamaño adecuado para la barra de tareas
-        font = ImageFont.truetype("segoeui.ttf", size=18)
-    except IOError:
-        font = ImageFont.load_default()
-
-    # Crear un lienzo temporal para medir el texto sin crearlo
-    temp_image = Image.new("RGBA", (1, 1))
-    temp_draw = ImageDraw.Draw(temp_image)
-    
-    # Calcular el bounding box del texto para obtener su ancho real
-    _, _, text_width, text_height = temp_draw.textbbox((0, 0), text, font=font)
+    font = get_font()
+
+    # Calcular el bounding box del texto para obtener su ancho real, sin lienzo temporal
+    _, _, text_width, text_height = font.getbbox(text)
     
     # Definir la altura del ícono y el padding
     icon_height = 24
@@ -104,6 +126,26 @@ def create_ninja_icon(text):
 
     return image
 
+@lru_cache(maxsize=ICON_CACHE_SIZE)
+def get_icon(text, ninja):
+    """
+    Devuelve el ícono para el texto y el modo indicados. Las salidas posibles son pocas
+    ("TARCA", "...", combinaciones de letras y sus variantes con "."), así que se memorizan.
+    Las imágenes devueltas se comparten: no deben modificarse.
+    """
+    return create_ninja_icon(text) if ninja else create_text_icon(text)
+
+def prerender_icons():
+    """Genera por adelantado los íconos de todas las respuestas de una y dos letras."""
+    answers = list(ANSWER_LETTERS) + ["".join(pair) for pair in combinations(ANSWER_LETTERS, 2)]
+    get_icon("TARCA", False)
+    get_icon("...", False)
+    get_icon("...", True)
+    for answer in answers:
+        get_icon(answer, True)
+        get_icon(answer, False)
+        get_icon(f"{answer}.", False)  # Variante "procesando" con la respuesta anterior
+
 def toggle_ninja_mode():
     """Activa o desactiva el modo ninja y actualiza el ícono para reflejar el cambio."""
     global ninja_mode_enabled
@@ -112,6 +154,23 @@ def toggle_ninja_mode():
     update_ticker(last_known_answer) if last_known_answer else reset_to_default_state()
 
 
+def show_stats():
+    """Muestra las estadísticas de latencia en una notificación y en la consola."""
+    if not stats_provider:
+        return
+    text = stats_provider()
+    print(f"\nEstadísticas de latencia:\n{text}")
+    if tray_icon:
+        try:
+            tray_icon.notify(text, "TARCA - Latencia")
+        except Exception as e:
+            print(f"No se pudo mostrar la notificación de estadísticas: {e}")
+
+def set_stats_provider(provider):
+    """Activa la entrada 'Estadísticas' del menú con la función que genera el texto."""
+    global stats_provider
+    stats_provider = provider
+
 def exit_action():
     """Notifica al hilo principal que debe terminar y detiene el ícono."""
     if shutdown_event_global:
@@ -124,7 +183,7 @@ def run_widget():
     global tray_icon
     
     # Crear un ícono inicial
-    initial_icon = create_text_icon("TARCA")
+    initial_icon = get_icon("TARCA", False)
     
     # Definir el menú del clic derecho
     menu = (
@@ -133,6 +192,11 @@ def run_widget():
             toggle_ninja_mode,
             checked=lambda item: ninja_mode_enabled
         ),
+        MenuItem(
+            'Estadísticas',
+            show_stats,
+            visible=lambda item: stats_provider is not None
+        ),
         Menu.SEPARATOR,
         MenuItem('Exit TARCA', exit_action)
     )
@@ -149,17 +213,15 @@ def _set_icon_state(text, title):
         return
 
     # Si el modo ninja está activo y el texto no es el de reseteo "TARCA", usa el ícono de puntos.
-    if ninja_mode_enabled and text != "TARCA":
-        new_icon = create_ninja_icon(text)
-    else:
-        # De lo contrario, usa el ícono de texto normal.
-        new_icon = create_text_icon(text)
+    # De lo contrario, usa el ícono de texto normal. Ambos salen de la caché de íconos.
+    new_icon = get_icon(text, ninja_mode_enabled and text != "TARCA")
     
     tray_icon.icon = new_icon
     tray_icon.title = title
 
 def show_processing_state():
     """Muestra un ícono de 'procesando' en la bandeja del sistema."""
+    _actualizaciones.inc(estado="procesando")
     if ninja_mode_enabled:
         processing_text = "..."
     elif last_known_answer:
@@ -170,13 +232,22 @@ def show_processing_state():
         processing_text = "..."
     _set_icon_state(processing_text, "TARCA")
 
+def show_last_answer():
+    """Vuelve a mostrar la última respuesta (captura sin cambios). Devuelve False si no hay ninguna."""
+    if not last_known_answer:
+        return False
+    _actualizaciones.inc(estado="repetida")
+    update_ticker(last_known_answer)
+    return True
+
 def reset_to_default_state():
     """Restaura el ícono al estado inicial."""
     global last_known_answer
+    _actualizaciones.inc(estado="reinicio")
     _set_icon_state("TARCA", "TARCA")
     last_known_answer = "" # Limpiar la última respuesta conocida
 
-def initialize_ticker(shutdown_event, ninja_mode_initial_state=False):
+def initialize_ticker(shutdown_event, ninja_mode_initial_state=False, prerender=False):
     """Inicializa y ejecuta el widget en un hilo separado."""
     global shutdown_event_global, ninja_mode_enabled
     shutdown_event_global = shutdown_event
@@ -185,6 +256,10 @@ def initialize_ticker(shutdown_event, ninja_mode_initial_state=False):
     icon_thread = threading.Thread(target=run_widget, daemon=True)
     icon_thread.start()
 
+    if prerender:
+        # Genera los íconos en segundo plano para que cada actualización sea una consulta a la caché
+        threading.Thread(target=prerender_icons, daemon=True).start()
+
 def update_ticker(data):
     """Función pública para actualizar el texto del widget desde el hilo principal."""
     global last_known_answer # Necesario para modificar la variable global
@@ -206,7 +281,10 @@ def update_ticker(data):
             except Exception as e:
                 # En caso de que el sonido del sistema no esté disponible o falle
                 print(f"No se pudo reproducir el sonido de notificación: {e}")
+                registro_metricas.registrar_error("bandeja", e)
 
         # Generar un nuevo ícono con el texto de la respuesta
         _set_icon_state(clean_data, f"TARCA")
+        _actualizaciones.inc(estado="respuesta")
+        _ultima_respuesta.fijar(round(time.time(), 3))
         last_known_answer = clean_data # Guardar la respuesta actual para el próximo procesamiento
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+# --- Configuración ---
+RUTA_TRAZAS = "trazas.jsonl"
+MAX_MUESTRAS_POR_ETAPA = 1000  # Muestras que se guardan en memoria para calcular percentiles
+MAX_TRAZAS_ACTIVAS = 64
+PERCENTILES = (50, 95, 99)
+
+def id_captura_desde_ruta(ruta):
+    """Id de captura a partir del nombre del archivo ('capturas/captura_<timestamp>.png' -> '<timestamp>')."""
+    nombre = os.path.splitext(os.path.basename(ruta))[0]
+    return nombre[len("captura_"):] if nombre.startswith("captura_") else nombre
+
+def percentil(valores_ordenados, p):
+    """Percentil por rango más cercano sobre una lista ya ordenada."""
+    if not valores_ordenados:
+        return None
+    indice = max(0, min(len(valores_ordenados), math.ceil(p / 100 * len(valores_ordenados))) - 1)
+    return valores_ordenados[indice]
+
+class Traza:
+    """Conjunto de etapas (spans) cronometradas de una misma captura."""
+    def __init__(self, registro, id_captura, inicio=None):
+        self.registro = registro
+        self.id_captura = id_captura
+        self.inicio = inicio or time.time()
+        self.ultimo_instante = self.inicio  # Fin de la última etapa registrada
+        self.finalizada = False
+
+    @contextmanager
+    def span(self, etapa, **extra):
+        """Cronometra el bloque como una etapa de la traza."""
+        inicio = time.time()
+        try:
+            yield
+        finally:
+            self.marcar(etapa, inicio, time.time(), **extra)
+
+    def marcar(self, etapa, inicio, fin=None, **extra):
+        """Registra una etapa medida externamente entre dos instantes (time.time())."""
+        fin = fin or time.time()
+        self.ultimo_instante = max(self.ultimo_instante, fin)
+        self.registro.registrar_span(self.id_captura, etapa, inicio, (fin - inicio) * 1000, **extra)
+
+    def marcar_desde_ultimo(self, etapa, **extra):
+        """Registra como etapa el tiempo transcurrido desde el fin de la etapa anterior."""
+        self.marcar(etapa, self.ultimo_instante, time.time(), **extra)
+
+    def finalizar(self, **extra):
+        """Registra la duración total de la captura y la retira de las trazas activas."""
+        if self.finalizada:
+            return
+        self.finalizada = True
+        self.marcar("total", self.inicio, time.time(), **extra)
+        self.registro.olvidar(self.id_captura)
+
+class RegistroTrazas:
+    """Recoge las etapas de todas las capturas, las escribe en JSONL y resume sus percentiles."""
+    def __init__(self, ruta=None, max_muestras=MAX_MUESTRAS_POR_ETAPA):
+        self.ruta = ruta  # None = solo estadísticas en memoria
+        self.max_muestras = max_muestras
+        self._muestras = {}  # etapa -> deque de duraciones en ms
+        self._activas = OrderedDict()  # id_captura -> Traza
+        self._bloqueo = threading.Lock()
+        self._archivo = None
+
+    def configurar(self, ruta=None):
+        """Activa (o desactiva con None) la escritura del archivo JSONL."""
+        with self._bloqueo:
+            if self._archivo:
+                self._archivo.close()
+                self._archivo = None
+            self.ruta = ruta
+
+    def nueva_traza(self, id_captura, inicio=None):
+        """Crea una traza y la deja localizable por su id hasta que se finalice."""
+        traza = Traza(self, id_captura, inicio)
+        with self._bloqueo:
+            self._activas[id_captura] = traza
+            while len(self._activas) > MAX_TRAZAS_ACTIVAS:
+                self._activas.popitem(last=False)
+        return traza
+
+    def obtener(self, id_captura):
+        """Devuelve la traza activa con ese id o crea una nueva si no existe."""
+        with self._bloqueo:
+            traza = self._activas.get(id_captura)
+        return traza or self.nueva_traza(id_captura)
+
+    def olvidar(self, id_captura):
+        with self._bloqueo:
+            self._activas.pop(id_captura, None)
+
+    def registrar_span(self, id_captura, etapa, inicio, duracion_ms, **extra):
+        with self._bloqueo:
+            self._muestras.setdefault(etapa, deque(maxlen=self.max_muestras)).append(duracion_ms)
+            if self.ruta:
+                self._escribir(dict(captura=id_captura, etapa=etapa, inicio=round(inicio, 6),
+                                    duracion_ms=round(duracion_ms, 3), **extra))
+
+    def _escribir(self, registro):
+        """Escribe una línea JSON (se llama con el bloqueo tomado)."""
+        try:
+            if self._archivo is None:
+                carpeta = os.path.dirname(self.ruta)
+                if carpeta:
+                    os.makedirs(carpeta, exist_ok=True)
+                self._archivo = open(self.ruta, "a", encoding="utf-8")
+            self._archivo.write(json.dumps(registro, ensure_ascii=False) + "\n")
+            self._archivo.flush()
+        except Exception as e:
+            print(f"Error al escribir la traza en '{self.ruta}': {e}")
+            self.ruta = None
+
+    def resumen(self):
+        """Devuelve {etapa: {"n", "p50", "p95", "p99"}} con las duraciones en ms."""
+        with self._bloqueo:
+            copias = {etapa: sorted(valores) for etapa, valores in self._muestras.items()}
+        return {
+            etapa: dict(n=len(valores), **{f"p{p}": round(percentil(valores, p), 1) for p in PERCENTILES})
+            for etapa, valores in copias.items() if valores
+        }
+
+    def texto_resumen(self, etapas=None):
+        """Resumen legible (una línea por etapa) para la consola o la bandeja."""
+        resumen = self.resumen()
+        if not resumen:
+            return "Sin datos de latencia todavía."
+        lineas = []
+        for etapa in (etapas or resumen):
+            if etapa in resumen:
+                datos = resumen[etapa]
+                lineas.append(f"{etapa}: p50 {datos['p50']} / p95 {datos['p95']} / p99 {datos['p99']} ms (n={datos['n']})")
+        return "\n".join(lineas)
+
+    def escribir_resumen(self):
+        """Añade al JSONL una línea con los percentiles actuales y cierra el archivo."""
+        with self._bloqueo:
+            ruta = self.ruta
+        if not ruta:
+            return
+        resumen = self.resumen()
+        with self._bloqueo:
+            self._escribir({"tipo": "resumen", "instante": round(time.time(), 6), "etapas": resumen})
+            if self._archivo:
+                self._archivo.close()
+                self._archivo = None
+
+# Registro global compartido por todos los módulos
+registro_trazas = RegistroTrazas()